@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
+from recipes import constants
 from recipes.models import (Tag,
                             Recipe,
                             Ingredient,
@@ -11,18 +15,42 @@ from recipes.models import (Tag,
 from recipes.forms import RecipeForm, RecipeIngredientInLineFormSet, FollowForm
 
 
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    (queryset.model._meta.db_table,))
+                row = cursor.fetchone()
+            if row and row[0] > constants.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+class BaseAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class RecipeIngredientInLine(admin.StackedInline):
     model = RecipeIngredient
     formset = RecipeIngredientInLineFormSet
+    autocomplete_fields = ('ingredient',)
     extra = 1
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(BaseAdmin):
     list_display = ('id', 'username', 'first_name',
-                    'last_name', 'email')
-    search_fields = ('username', 'email',)
-    list_filter = ('username', 'email',)
+                    'last_name', 'email', 'recipes_count', 'followers_count')
+    search_fields = ('^username', '^email',)
+    ordering = ('id',)
+    list_filter = ('is_staff', 'is_active',)
     exclude = ('password',)
 
 
@@ -34,49 +62,55 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(BaseAdmin):
     form = RecipeForm
     inlines = (RecipeIngredientInLine, )
-    list_display = ('pk', 'name', 'author', 'in_favorites')
-    search_fields = ('name',)
-    list_filter = ('name', 'author', 'tags',)
+    list_display = ('pk', 'name', 'author', 'favorites_count')
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
+    search_fields = ('^name', '=author__username',)
+    list_filter = ('tags',)
 
-    @admin.display(description='Раз в избранном')
-    def in_favorites(self, obj):
-        return obj.in_favorites.count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('search_vector')
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(BaseAdmin):
     list_display = ('pk', 'name', 'measurement_unit')
-    list_filter = ('name',)
-    search_fields = ('name',)
+    ordering = ('name',)
+    list_filter = ('measurement_unit',)
+    search_fields = ('^name',)
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(BaseAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount',)
-    list_filter = ('recipe', 'ingredient',)
-    search_fields = ('name',)
+    list_select_related = ('recipe__author', 'ingredient',)
+    autocomplete_fields = ('recipe', 'ingredient',)
+    search_fields = ('^recipe__name', '^ingredient__name',)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(BaseAdmin):
     form = FollowForm
     list_display = ('user', 'author')
-    list_filter = ('author',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'author',)
+    autocomplete_fields = ('user', 'author',)
+    search_fields = ('=user__username', '=author__username',)
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(BaseAdmin):
     list_display = ('user', 'recipe')
-    list_filter = ('user',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'recipe__author',)
+    autocomplete_fields = ('user', 'recipe',)
+    search_fields = ('=user__username', '^recipe__name',)
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(BaseAdmin):
     list_display = ('user', 'recipe')
-    list_filter = ('user',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'recipe__author',)
+    autocomplete_fields = ('user', 'recipe',)
+    search_fields = ('=user__username', '^recipe__name',)
@@ -0,0 +1,112 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.exceptions import (APIException, MethodNotAllowed,
+                                       NotAuthenticated, NotFound)
+
+from recipes import relations, shopping_list, views
+from recipes.authentication import CachedTokenAuthentication
+from recipes.renderers import ORJSONRenderer
+from recipes.serializers import (FavoriteSerializer, FollowAuthorSerializer,
+                                 ShoppingCartSerializer)
+
+
+def database_sync_to_async(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+def json_response(data, status_code):
+    return HttpResponse(ORJSONRenderer().render(data), status=status_code,
+                        content_type=ORJSONRenderer.media_type)
+
+
+def error_response(exc):
+    detail = exc.detail
+    if not isinstance(detail, (list, dict)):
+        detail = {'detail': detail}
+    response = json_response(detail, exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+@database_sync_to_async
+def authenticate(request):
+    credentials = CachedTokenAuthentication().authenticate(request)
+    if credentials is None:
+        raise NotAuthenticated
+    return credentials[0]
+
+
+def async_api_view(methods):
+    def decorator(handler):
+        @wraps(handler)
+        async def view(request, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise MethodNotAllowed(request.method)
+                request.user = await authenticate(request)
+                return await handler(request, **kwargs)
+            except Http404:
+                return error_response(NotFound())
+            except APIException as exc:
+                return error_response(exc)
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+toggle = database_sync_to_async(views.toggle)
+
+
+def toggle_response(data):
+    if data is None:
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+    return json_response(data, status.HTTP_201_CREATED)
+
+
+@async_api_view(('POST', 'DELETE'))
+async def favorite(request, pk):
+    return toggle_response(await toggle(
+        request, relations.favorites, pk, FavoriteSerializer))
+
+
+@async_api_view(('POST', 'DELETE'))
+async def shopping_cart(request, pk):
+    return toggle_response(await toggle(
+        request, relations.shopping_cart, pk, ShoppingCartSerializer))
+
+
+@async_api_view(('POST', 'DELETE'))
+async def subscribe(request, pk):
+    context = {'recipes_limit': views.parse_recipes_limit(request.GET)}
+    return toggle_response(await toggle(
+        request, relations.follows, pk, FollowAuthorSerializer, context))
+
+
+@database_sync_to_async
+def cart_content(request, file_format):
+    etag = shopping_list.cart_etag(request.user, file_format)
+    if get_conditional_response(request, etag=etag) is not None:
+        return etag, None
+    return etag, list(shopping_list.cart_ingredients(request.user))
+
+
+@async_api_view(('GET',))
+async def download_shopping_cart(request):
+    file_format = shopping_list.get_file_format(request.GET)
+    etag, ingredients = await cart_content(request, file_format)
+    if ingredients is None:
+        return get_conditional_response(request, etag=etag)
+    return shopping_list.file_response(ingredients, file_format, etag)
@@ -0,0 +1,61 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from rest_framework.authentication import TokenAuthentication
+
+from recipes import constants
+from recipes.caching import LRUCache
+from recipes.routers import use_primary
+
+local_cache = LRUCache(constants.TOKEN_CACHE_TTL, constants.TOKEN_CACHE_SIZE)
+
+
+def get_token_cache():
+    if settings.TOKEN_CACHE_ALIAS:
+        return caches[settings.TOKEN_CACHE_ALIAS]
+    return local_cache
+
+
+def cache_key(key):
+    return 'auth_token:{}'.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def invalidate_token(key):
+    get_token_cache().delete(cache_key(key))
+
+
+def field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def dump_credentials(user, token):
+    return ([getattr(user, name) for name in field_names(type(user))],
+            [getattr(token, name) for name in field_names(type(token))])
+
+
+def load_credentials(token_model, values):
+    user_model = get_user_model()
+    user_values, token_values = values
+    user = user_model.from_db(router.db_for_write(user_model),
+                              field_names(user_model), user_values)
+    token = token_model.from_db(router.db_for_write(token_model),
+                                field_names(token_model), token_values)
+    token.user = user
+    return user, token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        values = cache.get(cache_key(key))
+        if values is None:
+            with use_primary():
+                user, token = super().authenticate_credentials(key)
+            cache.set(cache_key(key), dump_credentials(user, token),
+                      constants.TOKEN_CACHE_TTL)
+            return user, token
+        return load_credentials(self.get_model(), values)
@@ -0,0 +1,28 @@
+from django.core.management.base import CommandError
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe, Tag, User
+
+
+def benchmark_fixtures():
+    user = (User.objects.annotate(following_count=Count('following'))
+            .order_by('-following_count', 'id').first())
+    recipe = Recipe.objects.order_by('id').first()
+    tag = Tag.objects.order_by('id').first()
+    if user is None or recipe is None or tag is None:
+        raise CommandError(
+            'Сначала заполните базу: python manage.py generate_dataset')
+    token, _ = Token.objects.get_or_create(user=user)
+    client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client, user, recipe, tag
+
+
+def read_response(client, url):
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    if response.status_code not in (200, 404):
+        raise CommandError(f'{url}: код ответа {response.status_code}')
+    return response
@@ -0,0 +1,51 @@
+from django.db import connections, router
+from django.db.models import Value
+
+INSERT_SQL = 'INSERT INTO {table} ({columns}) {rows} ON CONFLICT ({conflict}) '
+
+
+def select(queryset, *expressions):
+    names = [f'bulk_{index}' for index in range(len(expressions))]
+    return (queryset
+            .annotate(**{
+                name: (expression
+                       if hasattr(expression, 'resolve_expression')
+                       else Value(expression))
+                for name, expression in zip(names, expressions)})
+            .order_by()
+            .values_list(*names))
+
+
+def insert_select(model, columns, rows, conflict, action='DO NOTHING',
+                  returning=None):
+    using = router.db_for_write(model)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    sql, params = rows.query.get_compiler(using).as_sql()
+    sql = INSERT_SQL.format(
+        table=table, columns=', '.join(map(quote, columns)), rows=sql,
+        conflict=', '.join(map(quote, conflict)),
+    ) + action.format(table=table)
+    if returning is not None:
+        sql += ' RETURNING ' + quote(returning)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if returning is not None:
+            return [row[0] for row in cursor.fetchall()]
+    return None
+
+
+def delete_returning(model, filters, column, values):
+    using = router.db_for_write(model)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    conditions = [f'{quote(name)} = %s' for name in filters]
+    conditions.append('{} IN ({})'.format(
+        quote(column), ', '.join(['%s'] * len(values))))
+    sql = 'DELETE FROM {} WHERE {} RETURNING {}'.format(
+        quote(model._meta.db_table), ' AND '.join(conditions),
+        quote(column))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*filters.values(), *values])
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from recipes.routers import use_primary
+
+
+class ProcessCache:
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0
+        self._generation = 0
+
+    def load(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        self._generation += 1
+        self._data = None
+
+    def is_fresh(self):
+        return (self._data is not None
+                and time.monotonic() - self._loaded_at < self.ttl)
+
+    def get(self):
+        data = self._data
+        if data is not None and self.is_fresh():
+            return data
+        with self._lock:
+            if self.is_fresh():
+                return self._data
+            generation = self._generation
+            with use_primary():
+                data = self.load()
+            if generation == self._generation:
+                self._data = data
+                self._loaded_at = time.monotonic()
+            return data
+
+
+class LRUCache:
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def make_etag(data):
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return '"{}"'.format(hashlib.md5(content.encode()).hexdigest())
+
+
+def conditional_response(request, data, etag):
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    response = Response(data)
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Greatest
+
+from recipes.bulk import insert_select, select
+from recipes.models import (RecipeIngredient, ShoppingCart,
+                            ShoppingListItem, User)
+
+COLUMNS = ('user_id', 'ingredient_id', 'amount')
+CONFLICT = ('user_id', 'ingredient_id')
+ADD_AMOUNT = 'DO UPDATE SET amount = {table}.amount + excluded.amount'
+
+
+def bump_versions(users):
+    User.objects.filter(pk__in=users).update(
+        shopping_list_version=F('shopping_list_version') + 1)
+
+
+def increase(rows):
+    insert_select(ShoppingListItem, COLUMNS, rows, CONFLICT, ADD_AMOUNT)
+
+
+def decrease(items, amount):
+    items.update(amount=Greatest(F('amount') - amount, 0))
+    items.filter(amount=0).delete()
+
+
+def add_recipes(user_id, recipe_ids):
+    increase(select(
+        RecipeIngredient.objects
+        .filter(recipe_id__in=recipe_ids)
+        .values('ingredient'),
+        user_id, F('ingredient'), Sum('amount')))
+    bump_versions([user_id])
+
+
+def remove_recipes(user_id, recipe_ids):
+    ingredients = RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+    decrease(
+        ShoppingListItem.objects.filter(
+            user_id=user_id,
+            ingredient__in=ingredients.values('ingredient')),
+        Subquery(ingredients
+                 .filter(ingredient=OuterRef('ingredient'))
+                 .values('ingredient')
+                 .annotate(total=Sum('amount'))
+                 .values('total')))
+    bump_versions([user_id])
+
+
+def change_recipe(recipe_id, deltas):
+    carts = ShoppingCart.objects.filter(recipe_id=recipe_id)
+    for ingredient_id, delta in deltas.items():
+        if delta > 0:
+            increase(select(carts, F('user'), ingredient_id, delta))
+        elif delta < 0:
+            decrease(
+                ShoppingListItem.objects.filter(
+                    user__in=carts.values('user'),
+                    ingredient_id=ingredient_id),
+                -delta)
+    if any(deltas.values()):
+        bump_versions(carts.values('user'))
+
+
+def expected_totals(users):
+    return select(
+        ShoppingCart.objects
+        .filter(user__in=users, recipe__ingredient__isnull=False)
+        .values('user', 'recipe__ingredient__ingredient'),
+        F('user'), F('recipe__ingredient__ingredient'),
+        Sum('recipe__ingredient__amount'))
+
+
+def stored_totals(users):
+    return select(ShoppingListItem.objects.filter(user__in=users),
+                  F('user'), F('ingredient'), F('amount'))
+
+
+@transaction.atomic
+def rebuild(users):
+    ShoppingListItem.objects.filter(user__in=users).delete()
+    increase(expected_totals(users))
+    bump_versions(users)
@@ -11,3 +11,32 @@ PAGE_SIZE = 6
 TAGS_SLUG_REGEX = r'^[-a-zA-Z0-9_]+$'
 USERNAME_REGEX = r'^[\w.@+-]'
 COLOR_REGEX = r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$'
+INGREDIENT_INDEX_TTL = 300
+TAG_CACHE_TTL = 300
+IMAGE_THUMBNAIL_SIZE = (480, 480)
+IMAGE_WEBP_SIZE = (1600, 1600)
+IMAGE_WEBP_QUALITY = 80
+IMAGE_REDUCING_GAP = 2.0
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_WORKERS = 2
+BASE64_CHUNK_SIZE = 64 * 1024
+METRICS_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1,
+                            0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SEARCH_CONFIG = 'russian'
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 10000
+RECIPE_CACHE_TTL = 24 * 60 * 60
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_LIMIT = 200
+FEED_BATCH_SIZE = 1000
+FEED_WORKERS = 1
+BATCH_MAX_IDS = 100
+RECIPE_COMPACT_FIELDS = ('id', 'name', 'image', 'cooking_time',
+                         'is_favorited', 'is_in_shopping_cart')
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_ENCODINGS = ('br', 'gzip')
+COMPRESSION_CONTENT_TYPES = ('application/json', 'text/plain', 'text/csv')
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
@@ -0,0 +1,35 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Follow, Recipe, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects
+        .filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def recount(model, counter, related_model, related_field,
+            start=None, end=None):
+    queryset = model.objects.all()
+    if start is not None:
+        queryset = queryset.filter(pk__gte=start, pk__lt=end)
+    return queryset.update(
+        **{counter: count_subquery(related_model, related_field)})
+
+
+def change(model, pks, counter, delta):
+    model.objects.filter(pk__in=pks).update(
+        **{counter: Greatest(F(counter) + delta, 0)})
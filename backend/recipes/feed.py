@@ -0,0 +1,142 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
+
+from recipes import constants
+from recipes.bulk import insert_select, select
+from recipes.models import FeedEntry, Follow, Recipe, User
+from recipes.paginations import keyset
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=constants.FEED_WORKERS,
+                              thread_name_prefix='recipe-feed')
+
+
+def is_fan_out_on_read(author_id):
+    return User.objects.filter(
+        pk=author_id,
+        followers_count__gt=constants.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def fan_out(recipe_id, author_id, pub_date):
+    try:
+        if is_fan_out_on_read(author_id):
+            return
+        followers = (Follow.objects.filter(author_id=author_id)
+                     .order_by().values_list('user_id', flat=True))
+        entries = []
+        for user_id in followers.iterator(
+                chunk_size=constants.FEED_BATCH_SIZE):
+            entries.append(FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                                     author_id=author_id, pub_date=pub_date))
+            if len(entries) >= constants.FEED_BATCH_SIZE:
+                FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+                entries = []
+        FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s в ленты', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_fan_out(recipe):
+    recipe_id, author_id, pub_date = (recipe.pk, recipe.author_id,
+                                      recipe.pub_date)
+    transaction.on_commit(
+        lambda: executor.submit(fan_out, recipe_id, author_id, pub_date))
+
+
+def backfill(user_id, author_ids):
+    latest = (Recipe.objects.filter(author=OuterRef('author'))
+              .order_by('-pub_date', '-id')
+              .values('pk')[:constants.FEED_BACKFILL_LIMIT])
+    recipes = Recipe.objects.filter(
+        author_id__in=author_ids,
+        author__followers_count__lte=constants.FEED_FANOUT_MAX_FOLLOWERS,
+        pk__in=Subquery(latest),
+    )
+    insert_select(
+        FeedEntry, ('user_id', 'recipe_id', 'author_id', 'pub_date'),
+        select(recipes, user_id, F('pk'), F('author'), F('pub_date')),
+        ('user_id', 'recipe_id'))
+
+
+def remove(user_id, author_ids):
+    FeedEntry.objects.filter(user_id=user_id,
+                             author_id__in=author_ids).delete()
+
+
+def fill_followers(author_id, batch_size=constants.FEED_BATCH_SIZE):
+    recipes = list(
+        Recipe.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'pub_date')[:constants.FEED_BACKFILL_LIMIT])
+    if not recipes:
+        return 0
+    followers = (Follow.objects.filter(author_id=author_id)
+                 .order_by().values_list('user_id', flat=True))
+    created = 0
+    entries = []
+    for user_id in followers.iterator(chunk_size=batch_size):
+        entries += [FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                              author_id=author_id, pub_date=pub_date)
+                    for recipe_id, pub_date in recipes]
+        if len(entries) >= batch_size:
+            FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            created += len(entries)
+            entries = []
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return created + len(entries)
+
+
+def refill_followers(author_id):
+    try:
+        fill_followers(author_id)
+    except Exception:
+        logger.exception('Не удалось заполнить ленты подписчиков автора %s',
+                         author_id)
+    finally:
+        connection.close()
+
+
+def schedule_refill(author_ids):
+    authors = User.objects.filter(
+        pk__in=author_ids,
+        followers_count=constants.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('pk', flat=True)
+    for author_id in authors:
+        transaction.on_commit(
+            lambda author_id=author_id: executor.submit(refill_followers,
+                                                        author_id))
+
+
+class Feed:
+
+    def __init__(self, user, recipes):
+        self.user = user
+        self.recipes = recipes
+
+    def fetch(self, reverse, position, limit):
+        on_read = list(
+            Follow.objects
+            .filter(user=self.user,
+                    author__followers_count__gt=(
+                        constants.FEED_FANOUT_MAX_FOLLOWERS))
+            .values_list('author_id', flat=True))
+        rows = list(keyset(
+            FeedEntry.objects.filter(user=self.user)
+            .exclude(author_id__in=on_read),
+            reverse, position, id_field='recipe_id',
+        ).values_list('pub_date', 'recipe_id')[:limit])
+        if on_read:
+            rows += keyset(
+                Recipe.objects.filter(author_id__in=on_read),
+                reverse, position,
+            ).values_list('pub_date', 'id')[:limit]
+            rows = sorted(rows, reverse=not reverse)[:limit]
+        recipes = self.recipes.in_bulk([pk for _, pk in rows])
+        return [recipes[pk] for _, pk in rows if pk in recipes]
@@ -0,0 +1,33 @@
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_names(query_params, param, available, presets):
+    value = query_params.get(param, '')
+    if value in presets:
+        return presets[value]
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValidationError(
+            {param: 'Неизвестные поля: {}'.format(', '.join(unknown))})
+    return names
+
+
+def selected_fields(query_params, available, presets=None):
+    presets = presets or {}
+    fields = available
+    if query_params.get(FIELDS_PARAM):
+        names = parse_names(query_params, FIELDS_PARAM, available, presets)
+        fields = tuple(name for name in available if name in names)
+    if query_params.get(OMIT_PARAM):
+        names = parse_names(query_params, OMIT_PARAM, available, {})
+        fields = tuple(name for name in fields if name not in names)
+    return fields
+
+
+def readable_fields(serializer_class):
+    return tuple(name for name, field in serializer_class().fields.items()
+                 if not field.write_only)
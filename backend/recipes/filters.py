@@ -21,6 +21,7 @@ class RecipeFilter(filters.FilterSet):
         method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter')
+    search = filters.CharFilter(method='search_filter')
 
     class Meta:
         model = Recipe
@@ -35,3 +36,6 @@ class RecipeFilter(filters.FilterSet):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def search_filter(self, queryset, _, value):
+        return queryset.search(value)
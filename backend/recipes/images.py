@@ -0,0 +1,99 @@
+import binascii
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from PIL import Image
+
+from recipes import constants
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'image_thumbnail': constants.IMAGE_THUMBNAIL_SIZE,
+    'image_webp': constants.IMAGE_WEBP_SIZE,
+}
+
+executor = ThreadPoolExecutor(max_workers=constants.IMAGE_WORKERS,
+                              thread_name_prefix='recipe-images')
+
+
+def decode_base64_image(data):
+    header, encoded = data.split(';base64,')
+    ext = header.split('/')[-1]
+    file = TemporaryUploadedFile('temp.' + ext, header[len('data:'):], 0, None)
+    try:
+        for start in range(0, len(encoded), constants.BASE64_CHUNK_SIZE):
+            file.write(binascii.a2b_base64(
+                encoded[start:start + constants.BASE64_CHUNK_SIZE]))
+    except binascii.Error:
+        file.close()
+        raise
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+def variant_name(image_name, field):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return 'recipes/variants/{}_{}.webp'.format(stem, field)
+
+
+def has_current_variant(recipe, field):
+    variant = getattr(recipe, field)
+    return bool(recipe.image and variant
+                and variant.name == variant_name(recipe.image.name, field))
+
+
+def render_variant(image):
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=constants.IMAGE_WEBP_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def render_variants(file):
+    image = Image.open(file)
+    image.draft('RGB', max(VARIANTS.values()))
+    variants = {}
+    for field, size in sorted(VARIANTS.items(), key=lambda item: item[1],
+                              reverse=True):
+        image.thumbnail(size, reducing_gap=constants.IMAGE_REDUCING_GAP)
+        variants[field] = render_variant(image)
+    return variants
+
+
+def generate_variants(recipe_id, image_name):
+    try:
+        with default_storage.open(image_name) as file:
+            rendered = render_variants(file)
+        variants = {}
+        for field, content in rendered.items():
+            name = variant_name(image_name, field)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants[field] = default_storage.save(name, content)
+        Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+            version=F('version') + 1, **variants)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', image_name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    if not recipe.image or all(
+        has_current_variant(recipe, field) for field in VARIANTS
+    ):
+        return
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(generate_variants, recipe_id, image_name))
@@ -0,0 +1,30 @@
+from bisect import bisect_left
+
+from recipes import constants
+from recipes.caching import ProcessCache
+from recipes.models import Ingredient
+
+PREFIX_END = '\U0010ffff'
+
+
+class IngredientIndex(ProcessCache):
+
+    def load(self):
+        entries = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].casefold(),
+                              item['measurement_unit'], item['id'])
+        )
+        keys = [item['name'].casefold() for item in entries]
+        return keys, entries
+
+    def search(self, prefix=''):
+        keys, entries = self.get()
+        if not prefix:
+            return entries
+        prefix = prefix.casefold()
+        return entries[bisect_left(keys, prefix):
+                       bisect_left(keys, prefix + PREFIX_END)]
+
+
+ingredient_index = IngredientIndex(constants.INGREDIENT_INDEX_TTL)
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.benchmarks import benchmark_fixtures, read_response
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'data',
+                             'benchmark_baseline.json')
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = round(percent / 100 * (len(values) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку и число SQL-запросов ключевых эндпоинтов '
+            'и сравнивает их с сохранёнными базовыми значениями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--baseline', default=BASELINE_PATH,
+                            help='Путь к JSON-файлу с базовыми значениями')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Сохранить результаты как базовые')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимое ухудшение задержки, доля')
+
+    def scenarios(self):
+        client, _, recipe, tag = benchmark_fixtures()
+        return client, {
+            'recipe_list': '/api/recipes/',
+            'recipe_list_filtered':
+                f'/api/recipes/?tags={tag.slug}&is_favorited=1',
+            'recipe_list_cursor': '/api/recipes/?cursor=&limit=6',
+            'recipe_list_deep': '/api/recipes/?page=100&limit=6',
+            'recipe_detail': f'/api/recipes/{recipe.id}/',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'feed': '/api/recipes/feed/',
+            'shopping_list': '/api/recipes/download_shopping_cart/',
+            'shopping_list_items': '/api/recipes/shopping_list/',
+            'ingredient_search': '/api/ingredients/?name=%D0%BA',
+        }
+
+    def request(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            read_response(client, url)
+            elapsed = time.perf_counter() - start
+        return elapsed * 1000, len(queries)
+
+    def measure(self, client, url, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+        timings, queries = [], 0
+        for _ in range(iterations):
+            elapsed, count = self.request(client, url)
+            timings.append(elapsed)
+            queries = max(queries, count)
+        result = {f'p{percent}': round(percentile(timings, percent), 2)
+                  for percent in PERCENTILES}
+        result['queries'] = queries
+        return result
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                regressions.append('{}: SQL-запросов {} вместо {}'.format(
+                    name, result['queries'], expected['queries']))
+            if result['p95'] > expected['p95'] * (1 + tolerance):
+                regressions.append('{}: p95 {} мс вместо {} мс'.format(
+                    name, result['p95'], expected['p95']))
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть больше нуля')
+        client, scenarios = self.scenarios()
+        results = {}
+        for name, url in scenarios.items():
+            results[name] = self.measure(client, url, options['iterations'],
+                                         options['warmup'])
+            self.stdout.write('{:<22} p50 {p50:>8} мс  p95 {p95:>8} мс  '
+                              'p99 {p99:>8} мс  SQL {queries}'
+                              .format(name, **results[name]))
+
+        path = options['baseline']
+        if options['save_baseline']:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовые значения сохранены в {path}'))
+            return
+        if not os.path.exists(path):
+            self.stdout.write(f'Файл {path} не найден, сравнение пропущено')
+            return
+        with open(path, encoding='utf-8') as file:
+            regressions = self.compare(results, json.load(file),
+                                       options['tolerance'])
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
@@ -0,0 +1,105 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.management.commands.benchmark_api import PERCENTILES, percentile
+from recipes.management.commands.generate_dataset import USERNAME_PREFIX
+from recipes.models import Recipe, User
+
+CONCURRENCY = '1,8,32,64'
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер параллельными переключениями '
+            'избранного и списка покупок и скачиванием списка покупок. '
+            'Запустите один раз против gunicorn с WSGI и один раз против '
+            'uvicorn с ASGI, чтобы сравнить пропускную способность')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000',
+                            help='Адрес запущенного сервера')
+        parser.add_argument('--concurrency', default=CONCURRENCY,
+                            help='Уровни параллельности через запятую')
+        parser.add_argument('--requests', type=int, default=400,
+                            help='Число запросов на каждый уровень')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def clients(self, count):
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX)
+                     .order_by('id')[:count])
+        if len(users) < count:
+            raise CommandError(
+                'Сначала заполните базу: python manage.py generate_dataset')
+        clients = []
+        for user in users:
+            recipe = (Recipe.objects
+                      .exclude(in_favorites__user=user)
+                      .exclude(shopping_cart__user=user)
+                      .values_list('id', flat=True).first())
+            token, _ = Token.objects.get_or_create(user=user)
+            clients.append((token.key, recipe))
+        return clients
+
+    def plan(self, client, total):
+        token, recipe = client
+        steps = []
+        while len(steps) < total:
+            steps += [
+                (token, 'POST', f'/api/recipes/{recipe}/favorite/'),
+                (token, 'DELETE', f'/api/recipes/{recipe}/favorite/'),
+                (token, 'POST', f'/api/recipes/{recipe}/shopping_cart/'),
+                (token, 'DELETE', f'/api/recipes/{recipe}/shopping_cart/'),
+                (token, 'GET', '/api/recipes/download_shopping_cart/'),
+            ]
+        return steps[:total]
+
+    def request(self, step):
+        token, method, path = step
+        request = Request(self.base_url + path, method=method,
+                          headers={'Authorization': f'Token {token}'})
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                ok = response.status < 400
+        except (HTTPError, URLError):
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    def run_client(self, steps):
+        return [self.request(step) for step in steps]
+
+    def run_level(self, concurrency, total):
+        plans = [self.plan(client, total // concurrency or 1)
+                 for client in self.clients(concurrency)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = [result
+                       for results in executor.map(self.run_client, plans)
+                       for result in results]
+        elapsed = time.perf_counter() - start
+        timings = [timing for timing, _ in results]
+        result = {f'p{percent}': round(percentile(timings, percent), 2)
+                  for percent in PERCENTILES}
+        result['rps'] = round(len(results) / elapsed, 1)
+        result['errors'] = sum(1 for _, ok in results if not ok)
+        return result
+
+    def handle(self, *args, **options):
+        self.base_url = options['url'].rstrip('/')
+        self.timeout = options['timeout']
+        try:
+            levels = [int(level)
+                      for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency: список целых чисел')
+        for concurrency in levels:
+            result = self.run_level(concurrency, options['requests'])
+            self.stdout.write(
+                'параллельно {:>4}  {rps:>8} запр/с  p50 {p50:>8} мс  '
+                'p95 {p95:>8} мс  p99 {p99:>8} мс  ошибок {errors}'
+                .format(concurrency, **result))
@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.filters import IngredientFilter
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+from recipes.serializers import IngredientSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск ингредиентов через ORM и через индекс в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=2000,
+                            help='Сколько поисковых запросов выполнить')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def search_orm(self, prefix):
+        queryset = IngredientFilter(
+            {'name': prefix}, queryset=Ingredient.objects.all()).qs
+        return IngredientSerializer(queryset, many=True).data
+
+    def search_index(self, prefix):
+        return ingredient_index.search(prefix)
+
+    def measure(self, search, prefixes):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for prefix in prefixes:
+                search(prefix)
+            elapsed = time.perf_counter() - start
+        return elapsed, len(queries)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Сначала загрузите ингредиенты: csvimport')
+        rng = random.Random(options['seed'])
+        prefixes = [
+            name[:rng.randint(1, 4)]
+            for name in rng.choices(names, k=options['queries'])
+        ]
+        ingredient_index.invalidate()
+        for title, search in (('ORM', self.search_orm),
+                              ('Индекс', self.search_index)):
+            elapsed, queries = self.measure(search, prefixes)
+            self.stdout.write(
+                '{}: {} запросов за {:.3f} с, {:.1f} мкс на запрос, '
+                'SQL-запросов: {}'.format(
+                    title, len(prefixes), elapsed,
+                    elapsed / len(prefixes) * 10 ** 6, queries))
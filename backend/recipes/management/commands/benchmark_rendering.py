@@ -0,0 +1,60 @@
+import json
+import time
+
+import orjson
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from recipes.benchmarks import benchmark_fixtures, read_response
+from recipes.compression import compress
+from recipes.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает на страницах API процессорное время и размер ответа '
+            'при рендеринге через json и orjson и при сжатии gzip и brotli')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def scenarios(self):
+        client, _, recipe, _ = benchmark_fixtures()
+        return client, {
+            'recipe_list': '/api/recipes/?limit=50',
+            'recipe_list_compact': '/api/recipes/?limit=50&fields=compact',
+            'recipe_detail': f'/api/recipes/{recipe.id}/',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'shopping_list_items': '/api/recipes/shopping_list/',
+            'ingredients': '/api/ingredients/',
+        }
+
+    def cpu_time(self, func, iterations):
+        start = time.process_time()
+        for _ in range(iterations):
+            func()
+        return (time.process_time() - start) / iterations * 1000
+
+    def options(self, data):
+        json_renderer, orjson_renderer = JSONRenderer(), ORJSONRenderer()
+        body = orjson_renderer.render(data)
+        return (
+            ('render json', lambda: json_renderer.render(data), None),
+            ('render orjson', lambda: orjson_renderer.render(data), None),
+            ('parse json', lambda: json.loads(body), body),
+            ('parse orjson', lambda: orjson.loads(body), body),
+            ('gzip', lambda: compress(body, 'gzip'), None),
+            ('br', lambda: compress(body, 'br'), None),
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        if iterations < 1:
+            raise CommandError('--iterations должен быть больше нуля')
+        client, scenarios = self.scenarios()
+        for name, url in scenarios.items():
+            data = read_response(client, url).data
+            self.stdout.write(name)
+            for title, func, body in self.options(data):
+                elapsed = self.cpu_time(func, iterations)
+                self.stdout.write('  {:<14} {:>9.3f} мс  {:>9} байт'.format(
+                    title, elapsed, len(body or func())))
@@ -1,21 +1,141 @@
 import csv
+import json
 import os
+import re
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from recipes.models import Ingredient
 
 DATA_PATH = os.path.join(settings.BASE_DIR, 'data')
+BATCH_SIZE = 5000
+READ_SIZE = 64 * 1024
+SEPARATOR = re.compile(r'[\s,]*')
+
+
+class Rollback(Exception):
+    pass
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON-файл должен содержать список ингредиентов')
+    position = 1
+    while True:
+        position = SEPARATOR.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('JSON-файл оборван')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
 
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV- или JSON-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(DATA_PATH, 'ingredients.csv'),
+            help='Путь к файлу .csv или .json')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько строк вставлять одним запросом')
+        parser.add_argument(
+            '--benchmark', action='store_true',
+            help='Сравнить пакетную загрузку с построчной '
+                 'без сохранения изменений')
+
+    def rows(self, path):
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        with open(path, mode='r', encoding='utf-8') as file:
+            yield from reader(file)
+
+    def load_bulk(self, path, batch_size, verbosity=1):
+        rows = self.rows(path)
+        loaded = 0
+        start = time.perf_counter()
+        while True:
+            batch = [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            loaded += len(batch)
+            if verbosity:
+                elapsed = time.perf_counter() - start
+                self.stdout.write('Обработано строк: {} ({:.0f} строк/с)'
+                                  .format(loaded, loaded / elapsed))
+        return loaded
+
+    def load_per_row(self, path):
+        loaded = 0
+        for name, measurement_unit in self.rows(path):
+            Ingredient.objects.get_or_create(
+                name=name, measurement_unit=measurement_unit)
+            loaded += 1
+        return loaded
+
+    def measure(self, load):
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                loaded = load()
+                raise Rollback
+        except Rollback:
+            pass
+        return loaded, time.perf_counter() - start
 
-    def handle(self, *args, **kwargs):
-        file_path = os.path.join(DATA_PATH, 'ingredients.csv')
-        with open(file_path, mode='r') as file:
-            reader = csv.reader(file)
+    def benchmark(self, path, batch_size):
+        for title, load in (
+            ('Построчно', lambda: self.load_per_row(path)),
+            ('Пакетами', lambda: self.load_bulk(path, batch_size, 0)),
+        ):
+            loaded, elapsed = self.measure(load)
+            self.stdout.write('{}: {} строк за {:.2f} с ({:.0f} строк/с)'
+                              .format(title, loaded, elapsed,
+                                      loaded / elapsed))
 
-            for row in reader:
-                Ingredient.objects.get_or_create(name=row[0],
-                                                 measurement_unit=row[1])
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        if options['benchmark']:
+            return self.benchmark(path, batch_size)
+        before = Ingredient.objects.count()
+        start = time.perf_counter()
+        loaded = self.load_bulk(path, batch_size, options['verbosity'])
+        self.stdout.write(self.style.SUCCESS(
+            'Загружено строк: {}, новых ингредиентов: {}, за {:.2f} с'.format(
+                loaded, Ingredient.objects.count() - before,
+                time.perf_counter() - start)))
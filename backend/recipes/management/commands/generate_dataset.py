@@ -0,0 +1,169 @@
+import random
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag, User)
+
+BATCH_SIZE = 5000
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+USERNAME_PREFIX = 'dataset_user_'
+
+
+def zipf_weights(size, exponent):
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(size)))
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу детерминированным синтетическим набором данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--follows', type=float, default=5,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--favorites', type=float, default=10,
+                            help='Среднее число избранных на пользователя')
+        parser.add_argument('--carts', type=float, default=3,
+                            help='Среднее число рецептов в списке покупок')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def log(self, message):
+        if self.verbosity:
+            self.stdout.write(message)
+
+    def bulk_create(self, model, objects, **kwargs):
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(
+                objects[start:start + self.batch_size], **kwargs)
+
+    def new_ids(self, model, count):
+        return list(model.objects.order_by('-id')
+                    .values_list('id', flat=True)[:count])[::-1]
+
+    def count(self, mean):
+        return min(int(self.rng.expovariate(1 / mean)) if mean else 0,
+                   10 * int(mean) + 1)
+
+    def pick(self, population, weights, count):
+        count = min(count, len(population))
+        picked = set()
+        while len(picked) < count:
+            picked.update(self.rng.choices(population, cum_weights=weights,
+                                           k=count - len(picked)))
+        return picked
+
+    def create_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), '#E26C2D').save(buffer, 'PNG')
+        return default_storage.save('recipes/dataset.png',
+                                    ContentFile(buffer.getvalue()))
+
+    def create_users(self, count):
+        password = make_password(None)
+        self.bulk_create(User, [
+            User(username=f'{USERNAME_PREFIX}{number}',
+                 email=f'{USERNAME_PREFIX}{number}@example.com',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for number in range(count)
+        ])
+        return self.new_ids(User, count)
+
+    def create_recipes(self, count, authors, author_weights, image):
+        tags = list(Tag.objects.values_list('id', flat=True))
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        recipe_ids = []
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            Recipe.objects.bulk_create([
+                Recipe(name=f'Рецепт {start + number}',
+                       text='Описание рецепта ' * self.rng.randint(5, 50),
+                       cooking_time=self.rng.randint(5, 240),
+                       author_id=self.rng.choices(
+                           authors, cum_weights=author_weights)[0],
+                       image=image)
+                for number in range(size)
+            ])
+            batch_ids = self.new_ids(Recipe, size)
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in batch_ids
+                for tag_id in self.rng.sample(
+                    tags, self.rng.randint(1, len(tags)))
+            ])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe_id=recipe_id,
+                                 ingredient_id=ingredient_id,
+                                 amount=self.rng.randint(1, 500))
+                for recipe_id in batch_ids
+                for ingredient_id in self.rng.sample(
+                    ingredients, self.rng.randint(3, 10))
+            ])
+            recipe_ids += batch_ids
+            self.log(f'Рецептов: {len(recipe_ids)}')
+        return recipe_ids
+
+    def create_relations(self, model, field, users, targets, weights, mean):
+        objects = []
+        created = 0
+        for user_id in users:
+            for target_id in self.pick(targets, weights, self.count(mean)):
+                if model is Follow and target_id == user_id:
+                    continue
+                objects.append(model(user_id=user_id, **{field: target_id}))
+            if len(objects) >= self.batch_size:
+                model.objects.bulk_create(objects, ignore_conflicts=True)
+                created += len(objects)
+                objects = []
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        created += len(objects)
+        self.log(f'{model._meta.verbose_name_plural}: {created}')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Набор данных уже загружен')
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и рецепт')
+
+        call_command('csvimport', verbosity=0)
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color})
+
+        users = self.create_users(options['users'])
+        self.log(f'Пользователей: {len(users)}')
+        author_weights = zipf_weights(len(users), options['skew'])
+        recipes = self.create_recipes(options['recipes'], users,
+                                      author_weights, self.create_image())
+        recipe_weights = zipf_weights(len(recipes), options['skew'])
+
+        self.create_relations(Follow, 'author_id', users, users,
+                              author_weights, options['follows'])
+        self.create_relations(Favorite, 'recipe_id', users, recipes,
+                              recipe_weights, options['favorites'])
+        self.create_relations(ShoppingCart, 'recipe_id', users, recipes,
+                              recipe_weights, options['carts'])
+        call_command('recount_counters', batch_size=self.batch_size,
+                     verbosity=0)
+        call_command('rebuild_feed', batch_size=self.batch_size,
+                     verbosity=0)
+        call_command('rebuild_shopping_lists', verbosity=0)
+        self.stdout.write(self.style.SUCCESS('Набор данных загружен'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes import constants, feed
+from recipes.models import FeedEntry, User
+
+
+class Command(BaseCommand):
+    help = ('Заново заполняет ленты подписок из существующих подписок '
+            'и рецептов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=constants.FEED_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        FeedEntry.objects.all().delete()
+        authors = (User.objects
+                   .filter(followers_count__gt=0,
+                           followers_count__lte=(
+                               constants.FEED_FANOUT_MAX_FOLLOWERS))
+                   .order_by('id').values_list('id', flat=True))
+        created = 0
+        for author_id in authors.iterator():
+            created += feed.fill_followers(author_id, batch_size)
+        if options['verbosity']:
+            self.stdout.write(f'Записей в лентах: {created}')
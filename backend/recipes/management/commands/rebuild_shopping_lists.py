@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from recipes import cart_totals
+from recipes.models import User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Сверяет сохранённые списки покупок с рецептами в корзинах '
+            'и пересобирает их с нуля')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Сколько пользователей обрабатывать за раз')
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, ничего не изменяя')
+
+    def diverged(self, users):
+        expected = set(cart_totals.expected_totals(users))
+        stored = set(cart_totals.stored_totals(users))
+        return {user_id for user_id, _, _ in expected ^ stored}
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = User.objects.aggregate(last=Max('pk'))['last'] or 0
+        diverged = 0
+        for start in range(0, last_id + 1, batch_size):
+            users = User.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size).values('pk')
+            diverged += len(self.diverged(users))
+            if not options['check']:
+                cart_totals.rebuild(users)
+        if options['check'] and diverged:
+            raise CommandError(
+                f'Списки покупок расходятся у пользователей: {diverged}')
+        if options['verbosity']:
+            self.stdout.write('Списков покупок с расхождениями: {}{}'.format(
+                diverged, '' if options['check'] else ', пересобраны все'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from recipes.counters import COUNTERS, recount
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сохранённые счётчики избранного, '
+            'рецептов и подписчиков')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Сколько строк обновлять одним запросом')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, counter, related_model, related_field in COUNTERS:
+            last_id = model.objects.aggregate(last=Max('pk'))['last'] or 0
+            updated = 0
+            for start in range(0, last_id + 1, batch_size):
+                updated += recount(model, counter, related_model,
+                                   related_field, start, start + batch_size)
+            if options['verbosity']:
+                self.stdout.write('{}.{}: обновлено строк {}'.format(
+                    model._meta.model_name, counter, updated))
@@ -0,0 +1,157 @@
+import asyncio
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+
+from recipes import constants
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, view, value):
+        with self._lock:
+            counts, total = self._values.get(
+                view, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[view] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = {view: (list(counts), total)
+                      for view, (counts, total) in self._values.items()}
+        for view, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{view}",'
+                             f'le="{bucket}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса',
+    constants.METRICS_DURATION_BUCKETS)
+SQL_DURATION = Histogram(
+    'api_sql_duration_seconds', 'Суммарное время SQL-запросов за запрос',
+    constants.METRICS_DURATION_BUCKETS)
+SQL_QUERIES = Histogram(
+    'api_sql_queries', 'Количество SQL-запросов за запрос',
+    constants.METRICS_QUERIES_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, SQL_DURATION, SQL_QUERIES)
+
+current_counter = ContextVar('current_counter', default=None)
+
+
+def view_name(request):
+    match = request.resolver_match
+    if match is None:
+        return None
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+def count_query(execute, sql, params, many, context):
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def record_metrics(request, response, counter, duration):
+    response['Server-Timing'] = (
+        'db;dur={:.2f};desc="{} queries", total;dur={:.2f}'.format(
+            counter.duration * 1000, counter.queries, duration * 1000))
+    view = view_name(request)
+    if view is not None:
+        REQUEST_DURATION.observe(view, duration)
+        SQL_DURATION.observe(view, counter.duration)
+        SQL_QUERIES.observe(view, counter.queries)
+    return response
+
+
+@sync_and_async_middleware
+def query_metrics_middleware(get_response):
+    if not settings.API_METRICS:
+        raise MiddlewareNotUsed
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            counter = QueryCounter()
+            token = current_counter.set(counter)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current_counter.reset(token)
+            return record_metrics(request, response, counter,
+                                  time.perf_counter() - start)
+    else:
+        def middleware(request):
+            counter = QueryCounter()
+            token = current_counter.set(counter)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current_counter.reset(token)
+            return record_metrics(request, response, counter,
+                                  time.perf_counter() - start)
+    return middleware
+
+
+def is_metrics_scraper(request):
+    token = settings.API_METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+
+def metrics_view(request):
+    if not is_metrics_scraper(request):
+        return HttpResponseForbidden()
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+BATCH_SIZE = 5000
+
+
+def fill_shopping_lists(apps, schema_editor):
+    item_model = apps.get_model('recipes', 'ShoppingListItem')
+    totals = (
+        apps.get_model('recipes', 'RecipeIngredient').objects
+        .filter(recipe__shopping_cart__isnull=False)
+        .values('recipe__shopping_cart__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by()
+        .values_list('recipe__shopping_cart__user', 'ingredient', 'total')
+    )
+    items = []
+    for user_id, ingredient_id, amount in totals.iterator():
+        items.append(item_model(user_id=user_id, ingredient_id=ingredient_id,
+                                amount=amount))
+        if len(items) == BATCH_SIZE:
+            item_model.objects.bulk_create(items)
+            items = []
+    item_model.objects.bulk_create(items)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Позиции списка покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:00
+
+from django.db import migrations
+
+INDEXES = (
+    ('recipe_pub_date_idx', 'recipes_recipe', 'pub_date DESC, id DESC'),
+    ('recipe_author_pub_date_idx', 'recipes_recipe',
+     'author_id, pub_date DESC, id DESC'),
+    ('recipe_tags_tag_recipe_idx', 'recipes_recipe_tags',
+     'tag_id, recipe_id'),
+)
+
+
+def concurrently(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return ' CONCURRENTLY'
+    return ''
+
+
+def create_indexes(apps, schema_editor):
+    for name, table, columns in INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX{} IF NOT EXISTS {} ON {} ({});'.format(
+                concurrently(schema_editor), name, table, columns))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0010_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,11 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+import re
+
+from django.db import connections, models
+from django.db.models import (BooleanField, Case, Exists, F, FloatField,
+                              OuterRef, Prefetch, Q, Subquery, Value, When)
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import (MaxValueValidator,
                                     MinValueValidator,
                                     RegexValidator)
@@ -7,7 +13,49 @@ from django.core.validators import (MaxValueValidator,
 from . import constants
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+
+    def with_subscription(self, user=None):
+        if user is None or not user.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        return self.annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk'))))
+
+    def with_recipes_preview(self, limit=None):
+        recipes = Recipe.objects.all()
+        if limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects
+                .filter(author=OuterRef('author'))
+                .order_by('-pub_date', '-pk')
+                .values('pk')[:limit]
+            ))
+        return self.prefetch_related(
+            Prefetch('recipes', queryset=recipes,
+                     to_attr='preview_recipes'))
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+class CounterFieldsMixin:
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+                and field.name not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     username = models.CharField(max_length=constants.USER_FIELDS_MAX_LENGTH,
                                 unique=True,
                                 validators=(RegexValidator(
@@ -23,8 +71,18 @@ class User(AbstractUser):
                               verbose_name='Электронна почта')
     password = models.CharField(max_length=constants.USER_FIELDS_MAX_LENGTH,
                                 verbose_name='Пароль')
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Число рецептов')
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Число подписчиков')
+    shopping_list_version = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Версия списка покупок')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
+    counter_fields = ('recipes_count', 'followers_count',
+                      'shopping_list_version')
+
+    objects = CustomUserManager()
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -75,7 +133,60 @@ class Ingredient(models.Model):
         return f'{self.name}, мера: {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, user=None):
+        return self.prefetch_related(
+            Prefetch('author',
+                     queryset=User.objects.with_subscription(user)),
+            'tags',
+            Prefetch('ingredient',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+        )
+
+    def with_user_flags(self, user=None,
+                        flags=('is_favorited', 'is_in_shopping_cart')):
+        if user is None or not user.is_authenticated:
+            return self.annotate(**{
+                flag: Value(False, output_field=BooleanField())
+                for flag in flags
+            })
+        relations = {'is_favorited': Favorite,
+                     'is_in_shopping_cart': ShoppingCart}
+        return self.annotate(**{
+            flag: Exists(relations[flag].objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            for flag in flags
+        })
+
+    def with_author_subscription(self, user=None):
+        if user is None or not user.is_authenticated:
+            return self.annotate(is_author_subscribed=Value(
+                False, output_field=BooleanField()))
+        return self.annotate(
+            is_author_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author'))))
+
+    def search(self, value):
+        if connections[self.db].vendor == 'postgresql':
+            query = SearchQuery(value, config=constants.SEARCH_CONFIG,
+                                search_type='websearch')
+            queryset = self.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query))
+        else:
+            pattern = re.escape(value)
+            queryset = self.filter(
+                Q(name__iregex=pattern) | Q(text__iregex=pattern)
+            ).annotate(rank=Case(
+                When(name__iregex=pattern, then=Value(1.0)),
+                default=Value(0.5),
+                output_field=FloatField(),
+            ))
+        return queryset.order_by('-rank', *Recipe._meta.ordering)
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=constants.NAME_MAX_LENGTH,
                             verbose_name='Название рецепта')
     text = models.TextField(verbose_name='Текст рецепта')
@@ -103,11 +214,33 @@ class Recipe(models.Model):
     )
     image = models.ImageField(upload_to='recipes/',
                               verbose_name='Картинка')
+    image_thumbnail = models.ImageField(upload_to='recipes/variants/',
+                                        blank=True, editable=False,
+                                        verbose_name='Миниатюра')
+    image_webp = models.ImageField(upload_to='recipes/variants/',
+                                   blank=True, editable=False,
+                                   verbose_name='Картинка в WebP')
+    search_vector = SearchVectorField(null=True, editable=False,
+                                      verbose_name='Поисковый вектор')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Раз в избранном')
+    version = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Версия представления')
+
+    counter_fields = ('favorites_count', 'version')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+        )
 
     def __str__(self):
         return f'Рецепт {self.name}, автора {self.author}'
@@ -127,6 +260,12 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Количество ингредиента'
         verbose_name_plural = 'Количество ингредиентов'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient',
+            ),
+        )
 
     def __str__(self):
         return f'{self.ingredient} в количестве {self.amount}'
@@ -196,3 +335,56 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list', db_index=False,
+                             verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='+',
+                                   verbose_name='Ингредиент')
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} в количестве {self.amount} у {self.user}'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='feed', db_index=False,
+                             verbose_name='Читатель')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='feed_entries',
+                               verbose_name='Рецепт')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='Автор')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry',
+            ),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='feed_user_pub_date_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте у {self.user}'
@@ -1,8 +1,135 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from . import constants
 
 
+def keyset(queryset, reverse, position, date_field='pub_date',
+           id_field='id'):
+    if position is None:
+        return queryset.order_by(f'-{date_field}', f'-{id_field}')
+    pub_date, pk = position
+    if reverse:
+        return queryset.filter(
+            Q(**{f'{date_field}__gt': pub_date})
+            | Q(**{date_field: pub_date, f'{id_field}__gt': pk})
+        ).order_by(date_field, id_field)
+    return queryset.filter(
+        Q(**{f'{date_field}__lt': pub_date})
+        | Q(**{date_field: pub_date, f'{id_field}__lt': pk})
+    ).order_by(f'-{date_field}', f'-{id_field}')
+
+
 class CustomPaginator(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = constants.PAGE_SIZE
+
+
+class RecipePaginator(CustomPaginator):
+    cursor_query_param = 'cursor'
+    cursor_conflicting_params = ('ordering', 'search')
+    invalid_cursor_message = 'Неверный курсор'
+    conflicting_params_message = ('Курсор листает рецепты только по дате '
+                                  'публикации и не сочетается с {}')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.cursor = None
+            return super().paginate_queryset(queryset, request, view)
+        conflicts = [param for param in self.cursor_conflicting_params
+                     if param in request.query_params]
+        if conflicts:
+            raise ValidationError({self.cursor_query_param: (
+                self.conflicting_params_message.format(', '.join(conflicts)))})
+        return self.paginate_cursor(queryset, request)
+
+    def fetch(self, queryset, reverse, position, limit):
+        return list(keyset(queryset, reverse, position)[:limit])
+
+    def paginate_cursor(self, queryset, request):
+        self.request = request
+        self.cursor = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, ''))
+        page_size = self.get_page_size(request)
+        reverse, position = self.cursor
+        results = self.fetch(queryset, reverse, position, page_size + 1)
+        page = results[:page_size]
+        has_more = len(results) > page_size
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        if page:
+            self.first = (page[0].pub_date, page[0].id)
+            self.last = (page[-1].pub_date, page[-1].id)
+        else:
+            self.first = self.last = position
+        self.page = page
+        return page
+
+    def encode_cursor(self, reverse, position):
+        pub_date, pk = position
+        value = '{}|{}|{}'.format(int(reverse), pub_date.isoformat(), pk)
+        return urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return False, None
+        try:
+            reverse, pub_date, pk = (
+                urlsafe_b64decode(cursor.encode()).decode().split('|'))
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError
+            return bool(int(reverse)), (pub_date, int(pk))
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_link(self, reverse, position):
+        if position is None:
+            return replace_query_param(self.request.build_absolute_uri(),
+                                       self.cursor_query_param, '')
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(reverse, position))
+
+    def get_next_link(self):
+        if self.cursor is None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return self.get_cursor_link(False, self.last)
+
+    def get_previous_link(self):
+        if self.cursor is None:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        return self.get_cursor_link(True, self.first)
+
+    def get_paginated_response(self, data):
+        if self.cursor is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class FeedPaginator(RecipePaginator):
+
+    def paginate_queryset(self, feed, request, view=None):
+        return self.paginate_cursor(feed, request)
+
+    def fetch(self, feed, reverse, position, limit):
+        return feed.fetch(reverse, position, limit)
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Prefetch
+
+from recipes import constants
+from recipes.models import Recipe, RecipeIngredient
+from recipes.serializers import CachedRecipeSerializer
+from recipes.tag_cache import tag_cache
+
+FIELDS = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
+          'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+          'favorites_count')
+ROW_FIELDS = frozenset(('id', 'is_favorited', 'is_in_shopping_cart',
+                        'favorites_count'))
+PREFETCHED_FIELDS = frozenset(('tags', 'author', 'ingredients'))
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def get_cache():
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def cache_key(recipe):
+    return 'recipe:{}:{}'.format(recipe.id, recipe.version)
+
+
+def bump_versions(recipes):
+    recipes.update(version=F('version') + 1)
+
+
+def rows(user, fields=FIELDS):
+    recipes = (Recipe.objects
+               .only('id', 'version', 'author', 'pub_date', 'favorites_count')
+               .with_user_flags(user, [flag for flag in USER_FLAGS
+                                       if flag in fields]))
+    if 'author' in fields:
+        return recipes.with_author_subscription(user)
+    return recipes
+
+
+def load(recipe_ids):
+    recipes = (
+        Recipe.objects
+        .filter(pk__in=recipe_ids)
+        .select_related('author')
+        .prefetch_related(
+            'tags',
+            Prefetch('ingredient',
+                     RecipeIngredient.objects.select_related('ingredient')))
+    )
+    return {
+        recipe.id: (cache_key(recipe),
+                    dict(CachedRecipeSerializer(recipe).data))
+        for recipe in recipes
+    }
+
+
+def load_columns(recipe_ids, fields):
+    columns = {'id'}
+    serializer_fields = {'id'}
+    for field in fields:
+        if field == 'image':
+            columns.update(('image', 'image_thumbnail', 'image_webp'))
+            serializer_fields.update(('image', 'image_thumbnail'))
+        else:
+            columns.add(field)
+            serializer_fields.add(field)
+    recipes = Recipe.objects.filter(pk__in=recipe_ids).only(*columns)
+    return {
+        recipe.id: dict(CachedRecipeSerializer(
+            recipe, fields=serializer_fields).data)
+        for recipe in recipes
+    }
+
+
+def overlay(entry, recipe, request, thumbnail, fields=FIELDS):
+    data = {}
+    for field in fields:
+        if field in ROW_FIELDS:
+            data[field] = getattr(recipe, field)
+        elif field == 'tags':
+            tags = (tag_cache.detail(pk) for pk in entry['tags'])
+            data[field] = [tag[0] for tag in tags if tag is not None]
+        elif field == 'author':
+            data[field] = {**entry['author'],
+                           'is_subscribed': recipe.is_author_subscribed}
+        elif field == 'image':
+            image = entry['image_thumbnail'] if thumbnail else entry['image']
+            data[field] = request.build_absolute_uri(image) if image else None
+        else:
+            data[field] = entry[field]
+    return data
+
+
+def get_entries(recipes, fields):
+    cache = get_cache()
+    keys = {recipe.id: cache_key(recipe) for recipe in recipes}
+    cached = cache.get_many(keys.values())
+    entries = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in keys if pk not in entries]
+    if missing and PREFETCHED_FIELDS.intersection(fields):
+        loaded = load(missing)
+        cache.set_many(dict(loaded.values()), constants.RECIPE_CACHE_TTL)
+        entries.update((pk, entry) for pk, (_, entry) in loaded.items())
+    elif missing:
+        entries.update(load_columns(missing, fields))
+    return entries
+
+
+def represent(recipes, request, thumbnail, fields=FIELDS):
+    recipes = list(recipes)
+    cached_fields = set(fields) - ROW_FIELDS
+    if not cached_fields:
+        return [overlay(None, recipe, request, thumbnail, fields)
+                for recipe in recipes]
+    entries = get_entries(recipes, cached_fields)
+    return [overlay(entries[recipe.id], recipe, request, thumbnail, fields)
+            for recipe in recipes if recipe.id in entries]
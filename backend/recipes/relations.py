@@ -0,0 +1,112 @@
+from django.db import router, transaction
+from django.db.models import F
+
+from recipes import cart_totals, counters, feed
+from recipes.bulk import delete_returning, insert_select, select
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart, User
+
+
+class UserRelation:
+    model = None
+    field = None
+    exists_message = None
+
+    @property
+    def column(self):
+        return self.model._meta.get_field(self.field).column
+
+    @property
+    def target_model(self):
+        return self.model._meta.get_field(self.field).related_model
+
+    def targets(self, user):
+        return self.target_model.objects.all()
+
+    def validate(self, user, target):
+        return None
+
+    def added(self, user_id, target_ids):
+        pass
+
+    def removed(self, user_id, target_ids):
+        pass
+
+    def insert(self, user, targets):
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            created = set(insert_select(
+                self.model, ('user_id', self.column),
+                select(targets, user.id, F('pk')),
+                ('user_id', self.column), returning=self.column))
+            if created:
+                self.added(user.id, created)
+        return created
+
+    def add(self, user, target_ids):
+        targets = self.targets(user).filter(pk__in=target_ids)
+        found = set(targets.values_list('pk', flat=True))
+        if not found:
+            return found, set()
+        return found, self.insert(user, targets)
+
+    def add_one(self, user, target):
+        return bool(self.insert(user, self.targets(user).filter(pk=target.pk)))
+
+    def remove(self, user, target_ids):
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            deleted = set(delete_returning(
+                self.model, {'user_id': user.id}, self.column, target_ids))
+            if deleted:
+                self.removed(user.id, deleted)
+        return deleted
+
+
+class Favorites(UserRelation):
+    model = Favorite
+    field = 'recipe'
+    exists_message = 'Рецепт уже в избранном'
+
+    def added(self, user_id, target_ids):
+        counters.change(Recipe, target_ids, 'favorites_count', 1)
+
+    def removed(self, user_id, target_ids):
+        counters.change(Recipe, target_ids, 'favorites_count', -1)
+
+
+class ShoppingCartRecipes(UserRelation):
+    model = ShoppingCart
+    field = 'recipe'
+    exists_message = 'Рецепт уже в списке покупок'
+
+    def added(self, user_id, target_ids):
+        cart_totals.add_recipes(user_id, target_ids)
+
+    def removed(self, user_id, target_ids):
+        cart_totals.remove_recipes(user_id, target_ids)
+
+
+class Follows(UserRelation):
+    model = Follow
+    field = 'author'
+    exists_message = 'Пользователь уже подписан на автора'
+
+    def targets(self, user):
+        return User.objects.exclude(pk=user.pk)
+
+    def validate(self, user, target):
+        if target.pk == user.pk:
+            return 'Нельзя подписываться на самого себя'
+        return None
+
+    def added(self, user_id, target_ids):
+        feed.backfill(user_id, target_ids)
+        counters.change(User, target_ids, 'followers_count', 1)
+
+    def removed(self, user_id, target_ids):
+        feed.remove(user_id, target_ids)
+        counters.change(User, target_ids, 'followers_count', -1)
+        feed.schedule_refill(target_ids)
+
+
+favorites = Favorites()
+shopping_cart = ShoppingCartRecipes()
+follows = Follows()
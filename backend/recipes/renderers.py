@@ -0,0 +1,28 @@
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=JSONEncoder().default,
+                            option=options)
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        if renderer_context.get('indent'):
+            return True
+        if accepted_media_type:
+            _, _, params = accepted_media_type.partition(';')
+            return 'indent=' in params.replace(' ', '')
+        return False
@@ -0,0 +1,78 @@
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+
+PIN_COOKIE = 'primary_db'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+read_database = ContextVar('read_database', default=DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def use_primary():
+    token = read_database.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+def choose_read_database(request):
+    if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+        return DEFAULT_DB_ALIAS
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def pin_to_primary(request, response):
+    if request.method not in SAFE_METHODS:
+        response.set_cookie(PIN_COOKIE, '1',
+                            max_age=settings.REPLICA_PIN_SECONDS,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    if not settings.DATABASE_REPLICAS:
+        raise MiddlewareNotUsed
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = read_database.set(choose_read_database(request))
+            try:
+                response = await get_response(request)
+            finally:
+                read_database.reset(token)
+            return pin_to_primary(request, response)
+    else:
+        def middleware(request):
+            token = read_database.set(choose_read_database(request))
+            try:
+                response = get_response(request)
+            finally:
+                read_database.reset(token)
+            return pin_to_primary(request, response)
+    return middleware
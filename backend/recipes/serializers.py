@@ -1,6 +1,7 @@
-import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from django.core.exceptions import ValidationError
 
@@ -13,20 +14,81 @@ from recipes.models import (User,
                             ShoppingCart,
                             Follow
                             )
-from recipes.validators import tags_validator, ingredients_validator
+from recipes import cart_totals
+from recipes.bulk import delete_returning
+from recipes.validators import ingredients_validator
+from recipes.images import decode_base64_image, has_current_variant
 from . import constants
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+            try:
+                data = decode_base64_image(data)
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
+        data = super().to_internal_value(data)
+        width, height = data.image.size
+        if width * height > constants.IMAGE_MAX_PIXELS:
+            self.fail('too_many_pixels', max_pixels=constants.IMAGE_MAX_PIXELS)
+        return data
+
+
+def resolve_primary_keys(queryset, pks):
+    objects = queryset.in_bulk(pks)
+    for pk in pks:
+        if pk not in objects:
+            raise serializers.ValidationError(
+                serializers.PrimaryKeyRelatedField.default_error_messages[
+                    'does_not_exist'].format(pk_value=pk))
+    return [objects[pk] for pk in pks]
+
+
+class PrimaryKeyListField(serializers.ListField):
+    child = serializers.IntegerField()
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        return resolve_primary_keys(self.queryset,
+                                    super().to_internal_value(data))
+
+
+class RecipeImageField(Base64ImageField):
+    def __init__(self, thumbnail=None, **kwargs):
+        self.thumbnail = thumbnail
+        super().__init__(**kwargs)
+
+    def use_thumbnail(self):
+        if self.thumbnail is not None:
+            return self.thumbnail
+        view = self.context.get('view')
+        return getattr(view, 'action', None) == 'list'
+
+    def get_attribute(self, instance):
+        field = 'image_thumbnail' if self.use_thumbnail() else 'image_webp'
+        if has_current_variant(instance, field):
+            return getattr(instance, field)
+        return super().get_attribute(instance)
+
 
+class SparseFieldsMixin:
 
-class CustomUserSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class CustomUserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -39,6 +101,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
         }
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         if (self.context.get('request')
            and not self.context['request'].user.is_anonymous):
             user = self.context['request'].user
@@ -66,7 +130,7 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(read_only=True)
+    image = RecipeImageField(thumbnail=True, read_only=True)
 
     class Meta:
         model = Recipe
@@ -93,10 +157,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(source='ingredient')
 
     class Meta:
         model = RecipeIngredient
@@ -106,7 +167,7 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
 class RecipeSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientSerializer(many=True,
                                              source='ingredient')
-    image = Base64ImageField()
+    image = RecipeImageField(read_only=True)
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
@@ -118,26 +179,51 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
                   'name', 'image',
-                  'text', 'cooking_time')
+                  'text', 'cooking_time', 'favorites_count')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if (request and not request.user.is_anonymous):
             return request.user.favorite.filter(recipe=obj).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if (request and not request.user.is_anonymous):
             return request.user.carts.filter(recipe=obj).exists()
         return False
 
 
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class CachedRecipeSerializer(SparseFieldsMixin,
+                             serializers.ModelSerializer):
+    ingredients = RecipeIngredientSerializer(many=True, read_only=True,
+                                             source='ingredient')
+    author = RecipeAuthorSerializer(read_only=True)
+    image = RecipeImageField(thumbnail=False, read_only=True)
+    image_thumbnail = RecipeImageField(thumbnail=True, read_only=True,
+                                       source='image')
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'tags', 'author', 'ingredients', 'name',
+                  'image', 'image_thumbnail', 'text', 'cooking_time')
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientCreateSerializer(many=True)
     image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     cooking_time = serializers.IntegerField()
 
     class Meta:
@@ -156,38 +242,67 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredient_objs)
 
+    def validate_ingredients(self, value):
+        ingredients = resolve_primary_keys(
+            Ingredient.objects.all(), [item['ingredient'] for item in value])
+        return [{**item, 'ingredient': ingredient}
+                for item, ingredient in zip(value, ingredients)]
+
     def validate(self, data):
-        text = data.get('text')
-        name = data.get('name')
-        tags = data.get('tags')
-        ingredients = data.get('ingredients')
-        try:
-            cooking_time = int(data.get('cooking_time'))
-        except ValueError:
-            raise ValidationError('Время приготовления должно '
-                                  'быть целым числом')
-        if not isinstance(text, str) or not isinstance(name, str):
-            raise ValidationError(
-                'Описание и название рецепта должны быть текстом')
-        if (cooking_time < constants.MIN_COOKING_TIME
-           or cooking_time > constants.MAX_COOKING_TIME):
+        cooking_time = data.get('cooking_time')
+        if cooking_time is not None and (
+                cooking_time < constants.MIN_COOKING_TIME
+                or cooking_time > constants.MAX_COOKING_TIME):
             raise ValidationError('Время приготовления не может быть '
                                   'меньше 1 или больше 2880')
-        if len(name) > constants.NAME_MAX_LENGTH:
+        if len(data.get('name', '')) > constants.NAME_MAX_LENGTH:
             raise ValidationError('Слишком длинное название')
-        if not tags:
-            raise ValidationError('У рецепта должны быть теги')
-        if not ingredients:
-            raise ValidationError('В рецепте должен быть '
-                                  'хотя бы один ингредиент')
-        if not text:
-            raise ValidationError('У рецепта должно быть описание')
-        if not name:
-            raise ValidationError('У рецепта должно быть название')
-        tags_validator(tags, Tag)
-        ingredients_validator(ingredients, Ingredient)
+        for field, message in (
+            ('tags', 'У рецепта должны быть теги'),
+            ('ingredients', 'В рецепте должен быть хотя бы один ингредиент'),
+            ('text', 'У рецепта должно быть описание'),
+            ('name', 'У рецепта должно быть название'),
+        ):
+            if field in data and not data[field]:
+                raise ValidationError(message)
+        if 'ingredients' in data:
+            ingredients_validator(data['ingredients'])
         return data
 
+    def update_recipe_ingredient(self, instance, ingredients):
+        amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {item.ingredient_id: item
+                    for item in instance.ingredient.all()}
+        to_delete = []
+        to_update = []
+        deltas = {}
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is None:
+                deltas[ingredient_id] = -item.amount
+                to_delete.append(item.id)
+            elif item.amount != amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                to_update.append(item)
+        to_create = [ingredient for ingredient in ingredients
+                     if ingredient['ingredient'].id not in existing]
+        for ingredient in to_create:
+            deltas[ingredient['ingredient'].id] = ingredient['amount']
+        if to_delete:
+            delete_returning(RecipeIngredient, {'recipe_id': instance.id},
+                             'id', to_delete)
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            self.create_recipe_ingredient(instance, to_create)
+        if deltas:
+            cart_totals.change_recipe(instance.id, deltas)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -196,15 +311,30 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.create_recipe_ingredient(instance, ingredients)
         return instance
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.set(tags)
-        self.create_recipe_ingredient(instance, ingredients)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_recipe_ingredient(instance, ingredients)
         return super().update(instance, validated_data)
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], 'tags',
+            Prefetch('ingredient',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')))
         return RecipeSerializer(instance,
                                 context=self.context).data
 
@@ -215,13 +345,6 @@ class FollowAuthorSerializer(serializers.ModelSerializer):
         model = Follow
         fields = ('user', 'author')
 
-    def validate(self, data):
-        if data['user'].following.filter(author=data['author']).exists():
-            raise ValidationError('Пользователь уже подписан на автора')
-        if data['user'] == data['author']:
-            raise ValidationError('Нельзя подписываться на самого себя')
-        return data
-
     def to_representation(self, instance):
         return FollowingSerializer(instance.author,
                                    context=self.context).data
@@ -229,27 +352,24 @@ class FollowAuthorSerializer(serializers.ModelSerializer):
 
 class FollowingSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = '__all__'
+        fields = ('email', 'id', 'username',
+                  'first_name', 'last_name',
+                  'is_subscribed', 'recipes', 'recipes_count')
         read_only_fields = ('__all__',)
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            try:
-                recipes = recipes[:int(limit)]
-            except ValueError:
-                raise Exception(message='limit must be a number')
-        serializer = RecipeSerializer(recipes, context=self.context,
-                                      many=True, read_only=True)
+        if hasattr(obj, 'preview_recipes'):
+            recipes = obj.preview_recipes
+        else:
+            recipes = obj.recipes.all()
+            limit = self.context.get('recipes_limit')
+            if limit is not None:
+                recipes = recipes[:limit]
+        serializer = ShortRecipeSerializer(recipes, context=self.context,
+                                           many=True, read_only=True)
         return serializer.data
 
 
@@ -259,11 +379,6 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Favorite
         fields = '__all__'
 
-    def validate(self, data):
-        if data['user'].favorite.filter(recipe=data['recipe']).exists():
-            raise ValidationError('Рецепт уже в избранном')
-        return data
-
     def to_representation(self, instance):
         return ShortRecipeSerializer(instance.recipe,
                                      context=self.context).data
@@ -275,11 +390,17 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         model = ShoppingCart
         fields = '__all__'
 
-    def validate(self, data):
-        if data['user'].carts.filter(recipe=data['recipe']).exists():
-            raise ValidationError('Рецепт уже в списке покупок')
-        return data
-
     def to_representation(self, instance):
         return ShortRecipeSerializer(instance.recipe,
                                      context=self.context).data
+
+
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=constants.BATCH_MAX_IDS,
+        error_messages={
+            'max_length': 'Не больше {max_length} id за один запрос'})
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
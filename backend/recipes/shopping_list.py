@@ -0,0 +1,170 @@
+import csv
+import hashlib
+
+from django.http.response import StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import ShoppingListItem, User
+
+TITLE = 'Cписок покупок'
+CHUNK_SIZE = 2000
+PDF_LINES_PER_PAGE = 50
+PDF_CYRILLIC = (
+    [f'/afii{code}' for code in range(10017, 10023)]
+    + [f'/afii{code}' for code in range(10024, 10050)]
+    + [f'/afii{code}' for code in range(10065, 10071)]
+    + [f'/afii{code}' for code in range(10072, 10098)]
+)
+
+
+def cart_rows(user):
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .order_by('ingredient__name', 'ingredient')
+        .values_list('ingredient', 'ingredient__name',
+                     'ingredient__measurement_unit', 'amount')
+    )
+
+
+def cart_items(user):
+    return [{'id': ingredient_id, 'name': name,
+             'measurement_unit': measurement_unit, 'amount': amount}
+            for ingredient_id, name, measurement_unit, amount
+            in cart_rows(user)]
+
+
+def cart_ingredients(user):
+    rows = cart_rows(user).iterator(chunk_size=CHUNK_SIZE)
+    for _, name, measurement_unit, amount in rows:
+        yield name, amount, measurement_unit
+
+
+def cart_etag(user, file_format):
+    version = (User.objects.filter(pk=user.pk)
+               .values_list('shopping_list_version', flat=True).get())
+    return '"{}"'.format(hashlib.md5(
+        f'{user.pk}:{version}:{file_format}'.encode()).hexdigest())
+
+
+def render_txt(ingredients):
+    yield TITLE + ':'
+    for ingredient in ingredients:
+        yield '\n___ {} - {} {}'.format(*ingredient)
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for name, amount, measurement_unit in ingredients:
+        yield writer.writerow((name, amount, measurement_unit))
+
+
+def _pdf_text(value):
+    value = value.encode('cp1251', errors='replace')
+    for char in (b'\\', b'(', b')'):
+        value = value.replace(char, b'\\' + char)
+    return b'(' + value + b')'
+
+
+class PdfWriter:
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+
+    def raw(self, data):
+        self.position += len(data)
+        return data
+
+    def obj(self, number, body):
+        self.offsets[number] = self.position
+        return self.raw(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def page(self, number, lines):
+        content = [b'BT /F1 11 Tf 14 TL 50 792 Td']
+        content += [_pdf_text(line) + b' Tj T*' for line in lines]
+        content.append(b'ET')
+        stream = b'\n'.join(content)
+        return self.obj(
+            number,
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R >> >> '
+            b'/Contents %d 0 R >>' % (number + 1)
+        ) + self.obj(
+            number + 1,
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream)
+        )
+
+    def trailer(self, pages):
+        kids = b' '.join(b'%d 0 R' % page for page in pages)
+        data = self.obj(
+            2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(pages))
+        )
+        data += self.obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        data += self.obj(
+            3,
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            b'/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+            b'/Differences [168 /afii10023 184 /afii10071 192 %s] >> >>'
+            % ' '.join(PDF_CYRILLIC).encode()
+        )
+        size = max(self.offsets) + 1
+        xref = self.position
+        data += b'xref\n0 %d\n0000000000 65535 f \n' % size
+        data += b''.join(b'%010d 00000 n \n' % self.offsets[number]
+                         for number in range(1, size))
+        data += (b'trailer\n<< /Size %d /Root 1 0 R >>\n'
+                 b'startxref\n%d\n%%%%EOF\n' % (size, xref))
+        return data
+
+
+def render_pdf(ingredients):
+    writer = PdfWriter()
+    yield writer.raw(b'%PDF-1.4\n')
+    pages = []
+    lines = [TITLE + ':', '']
+    for ingredient in ingredients:
+        lines.append('{} - {} {}'.format(*ingredient))
+        if len(lines) == PDF_LINES_PER_PAGE:
+            pages.append(4 + 2 * len(pages))
+            yield writer.page(pages[-1], lines)
+            lines = []
+    if lines or not pages:
+        pages.append(4 + 2 * len(pages))
+        yield writer.page(pages[-1], lines)
+    yield writer.trailer(pages)
+
+
+FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
+
+
+def get_file_format(query_params):
+    file_format = query_params.get('file_format', 'txt')
+    if file_format not in FORMATS:
+        raise ValidationError(
+            {'file_format': 'Доступные форматы: {}'.format(
+                ', '.join(FORMATS))})
+    return file_format
+
+
+def file_response(ingredients, file_format, etag):
+    render, content_type = FORMATS[file_format]
+    response = StreamingHttpResponse(render(ingredients),
+                                     content_type=content_type)
+    response['ETag'] = etag
+    response['Content-Disposition'] = (
+        'attachment; filename=shopping_list.{}'.format(file_format))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,188 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.authentication import invalidate_token
+from recipes import cart_totals, counters, feed, relations
+from recipes.images import schedule_variants
+from recipes.ingredient_index import ingredient_index
+from recipes.metrics import install_query_counter
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, User)
+from recipes.recipe_cache import bump_versions
+from recipes.tag_cache import tag_cache
+
+
+@receiver(connection_created)
+def count_queries(connection, **kwargs):
+    install_query_counter(connection)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_cache(**kwargs):
+    tag_cache.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(instance, **kwargs):
+    schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, **kwargs):
+    if created:
+        return
+    tokens = Token.objects.filter(user=instance).values_list('key', flat=True)
+    for key in tokens:
+        invalidate_token(key)
+
+
+@receiver(post_save, sender=Recipe)
+def bump_recipe_version(instance, created, **kwargs):
+    if not created:
+        bump_versions(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def bump_recipe_version_on_ingredients(instance, **kwargs):
+    bump_versions(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_save, sender=Ingredient)
+def bump_recipe_version_on_ingredient(instance, created, **kwargs):
+    if not created:
+        bump_versions(Recipe.objects.filter(ingredient__ingredient=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+def bump_shopping_list_version_on_ingredient(instance, created, **kwargs):
+    if not created:
+        cart_totals.bump_versions(
+            ShoppingListItem.objects.filter(ingredient=instance)
+            .values('user'))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_version_on_tags(instance, action, reverse, pk_set,
+                                **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_versions(Recipe.objects.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        bump_versions(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        bump_versions(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipe_versions(instance, created, update_fields,
+                                **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    bump_versions(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        feed.schedule_fan_out(instance)
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=Follow)
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=RecipeIngredient)
+@receiver(pre_save, sender=Recipe)
+def remember_previous_row(sender, instance, **kwargs):
+    instance.previous_row = None
+    if not instance._state.adding:
+        instance.previous_row = sender.objects.filter(pk=instance.pk).first()
+
+
+def save_relation(relation, instance):
+    target_id = getattr(instance, relation.column)
+    previous = getattr(instance, 'previous_row', None)
+    if previous is not None:
+        previous_target_id = getattr(previous, relation.column)
+        if (previous.user_id == instance.user_id
+                and previous_target_id == target_id):
+            return
+        relation.removed(previous.user_id, [previous_target_id])
+    relation.added(instance.user_id, [target_id])
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_cart(instance, **kwargs):
+    save_relation(relations.shopping_cart, instance)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_cart(instance, **kwargs):
+    relations.shopping_cart.removed(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favorite)
+def add_to_favorites(instance, **kwargs):
+    save_relation(relations.favorites, instance)
+
+
+@receiver(post_delete, sender=Favorite)
+def remove_from_favorites(instance, **kwargs):
+    relations.favorites.removed(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Follow)
+def follow_author(instance, **kwargs):
+    save_relation(relations.follows, instance)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_author(instance, **kwargs):
+    relations.follows.removed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_shopping_lists(instance, **kwargs):
+    deltas = {instance.ingredient_id: instance.amount}
+    previous = getattr(instance, 'previous_row', None)
+    if previous is not None and previous.recipe_id != instance.recipe_id:
+        cart_totals.change_recipe(previous.recipe_id,
+                                  {previous.ingredient_id: -previous.amount})
+    elif previous is not None:
+        deltas[previous.ingredient_id] = (
+            deltas.get(previous.ingredient_id, 0) - previous.amount)
+    cart_totals.change_recipe(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def update_shopping_lists_on_delete(instance, **kwargs):
+    cart_totals.change_recipe(instance.recipe_id,
+                              {instance.ingredient_id: -instance.amount})
+
+
+@receiver(post_save, sender=Recipe)
+def change_recipes_count(instance, **kwargs):
+    previous = getattr(instance, 'previous_row', None)
+    if previous is not None:
+        if previous.author_id == instance.author_id:
+            return
+        counters.change(User, [previous.author_id], 'recipes_count', -1)
+    counters.change(User, [instance.author_id], 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    counters.change(User, [instance.author_id], 'recipes_count', -1)
@@ -0,0 +1,26 @@
+from recipes import constants
+from recipes.caching import ProcessCache, make_etag
+from recipes.models import Tag
+from recipes.serializers import TagSerializer
+
+
+class TagCache(ProcessCache):
+
+    def load(self):
+        tags = TagSerializer(Tag.objects.order_by('id'), many=True).data
+        return {
+            'list': (tags, make_etag(tags)),
+            'detail': {
+                str(tag['id']): (tag, make_etag(tag))
+                for tag in tags
+            },
+        }
+
+    def list(self):
+        return self.get()['list']
+
+    def detail(self, pk):
+        return self.get()['detail'].get(str(pk))
+
+
+tag_cache = TagCache(constants.TAG_CACHE_TTL)
@@ -0,0 +1,1464 @@
+import asyncio
+import base64
+import gzip
+import re
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+import brotli
+import orjson
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (AsyncClient, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from recipes import cart_totals, constants, feed, images
+from recipes.authentication import (CachedTokenAuthentication, cache_key,
+                                    local_cache)
+from recipes.compression import choose_encoding, compress_response
+from recipes.metrics import metrics_view, query_metrics_middleware
+from recipes.models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, User)
+from recipes.parsers import ORJSONParser
+from recipes.renderers import ORJSONRenderer
+from recipes.routers import PIN_COOKIE
+from recipes.tag_cache import tag_cache
+from recipes.urls import async_urlpatterns
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+urlpatterns = [
+    path('api/', include('recipes.urls')),
+    path('async/', include(async_urlpatterns)),
+]
+
+
+def image_file():
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='recipe.png')
+
+
+def create_user(number):
+    return User.objects.create_user(
+        email=f'user{number}@example.com', username=f'user{number}',
+        first_name='Имя', last_name='Фамилия', password='password-123')
+
+
+def create_recipe(author, ingredients=(), tags=(), name='Рецепт'):
+    recipe = Recipe.objects.create(author=author, name=name, text='Текст',
+                                   cooking_time=10, image=image_file())
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in ingredients)
+    return recipe
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DATABASE_REPLICAS=[])
+class APITestCase(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.author = create_user(1)
+        cls.tag = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                     slug='breakfast')
+        cls.salt = Ingredient.objects.create(name='Соль',
+                                             measurement_unit='г')
+        cls.sugar = Ingredient.objects.create(name='Сахар',
+                                              measurement_unit='г')
+
+    def setUp(self):
+        self.reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def reset_caches(self):
+        caches['default'].clear()
+        tag_cache.invalidate()
+
+
+class RecipeCacheTest(APITestCase):
+
+    def test_ingredient_rename_refreshes_cached_recipe(self):
+        recipe = create_recipe(self.author, [(self.salt, 5)], [self.tag])
+        url = f'/api/recipes/{recipe.id}/'
+        self.assertEqual(
+            self.client.get(url).json()['ingredients'][0]['name'], 'Соль')
+        self.salt.name = 'Морская соль'
+        self.salt.save()
+        self.assertEqual(
+            self.client.get(url).json()['ingredients'][0]['name'],
+            'Морская соль')
+
+    def test_ingredient_delete_refreshes_cached_recipe(self):
+        recipe = create_recipe(self.author, [(self.salt, 5), (self.sugar, 1)])
+        url = f'/api/recipes/{recipe.id}/'
+        self.assertEqual(len(self.client.get(url).json()['ingredients']), 2)
+        self.sugar.delete()
+        self.assertEqual(len(self.client.get(url).json()['ingredients']), 1)
+
+
+class SubscriptionsTest(APITestCase):
+    url = '/api/users/subscriptions/'
+
+    def follow_authors(self, count):
+        for _ in range(count):
+            author = create_user(100 + Follow.objects.count())
+            for _ in range(3):
+                create_recipe(author)
+            Follow.objects.create(user=self.user, author=author)
+
+    def test_query_count_does_not_grow_with_authors(self):
+        for count, total in ((1, 1), (4, 5)):
+            self.follow_authors(count)
+            with self.assertNumQueries(3):
+                response = self.client.get(self.url, {'recipes_limit': 2})
+            self.assertEqual(response.json()['count'], total)
+            for author in response.json()['results']:
+                self.assertEqual(len(author['recipes']), 2)
+
+    def test_recipes_limit_zero_returns_empty_preview(self):
+        self.follow_authors(1)
+        response = self.client.get(self.url, {'recipes_limit': 0})
+        self.assertEqual(response.json()['results'][0]['recipes'], [])
+
+    def test_invalid_recipes_limit(self):
+        self.follow_authors(1)
+        subscribe_url = f'/api/users/{self.author.id}/subscribe/'
+        for value in ('-1', 'abc', '1.5'):
+            with self.subTest(value=value):
+                response = self.client.get(self.url, {'recipes_limit': value})
+                self.assertEqual(response.status_code, 400)
+                response = self.client.post(
+                    f'{subscribe_url}?recipes_limit={value}')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(
+            Follow.objects.filter(user=self.user, author=self.author).exists())
+
+
+class TagCacheTest(APITestCase):
+    url = '/api/tags/'
+
+    def test_etag_is_the_same_in_every_worker(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        self.reset_caches()
+        self.assertEqual(self.client.get(self.url)['ETag'], response['ETag'])
+
+    def test_matching_etag_is_not_modified_without_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_tag_is_edited(self):
+        etag = self.client.get(f'{self.url}{self.tag.id}/')['ETag']
+        self.tag.name = 'Обед'
+        self.tag.save()
+        response = self.client.get(f'{self.url}{self.tag.id}/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Обед')
+
+    def test_if_modified_since_alone_is_ignored(self):
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE='Wed, 21 Oct 2099 07:28:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+
+class RecipeSearchTest(APITestCase):
+
+    def search(self, value):
+        response = self.client.get('/api/recipes/', {'search': value})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_search_ignores_case_of_cyrillic_letters(self):
+        create_recipe(self.author, name='Обед')
+        recipe = create_recipe(self.author, name='Украинский суп')
+        recipe.text = 'Готовим борщ на говяжьем бульоне'
+        recipe.save()
+        create_recipe(self.author, name='Борщ')
+        self.assertEqual(self.search('борщ'), ['Борщ', 'Украинский суп'])
+        self.assertEqual(self.search('БОРЩ'), ['Борщ', 'Украинский суп'])
+
+    def test_search_treats_query_as_text(self):
+        create_recipe(self.author, name='Борщ (постный)')
+        create_recipe(self.author, name='Борщ')
+        self.assertEqual(self.search('(Постный)'), ['Борщ (постный)'])
+
+
+class RecipeFieldsetsTest(APITestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = create_recipe(cls.author, [(cls.salt, 5)], [cls.tag])
+
+    def test_unknown_names_are_rejected(self):
+        for url in (self.url, f'{self.url}{self.recipe.id}/'):
+            for param in ('fields', 'omit'):
+                with self.subTest(url=url, param=param):
+                    response = self.client.get(url, {param: 'name,secret'})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('secret', response.json()[param])
+
+    def test_compact_preset(self):
+        response = self.client.get(self.url, {'fields': 'compact'})
+        self.assertEqual(set(response.json()['results'][0]),
+                         set(constants.RECIPE_COMPACT_FIELDS))
+
+    def test_fields_and_omit_combine(self):
+        response = self.client.get(self.url, {'fields': 'id,name,text',
+                                              'omit': 'text'})
+        self.assertEqual(list(response.json()['results'][0]), ['id', 'name'])
+
+    def test_omitted_flags_are_not_queried(self):
+        tables = ('recipes_favorite', 'recipes_shoppingcart')
+        for params, queried in (({}, True),
+                                ({'omit': 'is_favorited,is_in_shopping_cart'},
+                                 False)):
+            with self.subTest(params=params):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 200)
+                sql = ' '.join(query['sql'] for query in queries)
+                for table in tables:
+                    self.assertEqual(table in sql, queried, table)
+
+
+class RecipeCursorPaginationTest(APITestCase):
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.start = timezone.now() - timedelta(days=1)
+        for number in range(5):
+            cls.create_recipe(cls.start + timedelta(minutes=number // 2))
+
+    @classmethod
+    def create_recipe(cls, pub_date):
+        recipe = create_recipe(cls.author)
+        Recipe.objects.filter(pk=recipe.pk).update(pub_date=pub_date)
+        return recipe
+
+    def expected_ids(self):
+        return list(Recipe.objects.order_by('-pub_date', '-id')
+                    .values_list('id', flat=True))
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [recipe['id'] for recipe in data['results']], data
+
+    def walk(self, url, before_next=None):
+        ids = []
+        while url:
+            page, data = self.get(url)
+            ids += page
+            if before_next is not None:
+                before_next()
+                before_next = None
+            url = data['next']
+        return ids
+
+    def test_first_page(self):
+        ids, data = self.get(self.url, {'cursor': '', 'limit': 2})
+        self.assertEqual(ids, self.expected_ids()[:2])
+        self.assertIsNone(data['previous'])
+        self.assertIn('cursor=', data['next'])
+        self.assertNotIn('count', data)
+
+    def test_next_and_previous_round_trip(self):
+        first, data = self.get(self.url, {'cursor': '', 'limit': 2})
+        second, data = self.get(data['next'])
+        self.assertEqual(second, self.expected_ids()[2:4])
+        previous, _ = self.get(data['previous'])
+        self.assertEqual(previous, first)
+        self.assertEqual(self.walk(f'{self.url}?cursor=&limit=2'),
+                         self.expected_ids())
+
+    def test_rows_inserted_between_pages(self):
+        expected = self.expected_ids()
+        newest = self.create_recipe(timezone.now())
+        oldest = self.create_recipe(self.start - timedelta(minutes=1))
+
+        def insert():
+            self.create_recipe(timezone.now())
+            self.create_recipe(self.start - timedelta(minutes=2))
+
+        ids = self.walk(f'{self.url}?cursor=&limit=2', insert)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids[:len(expected) + 2],
+                         [newest.id] + expected + [oldest.id])
+        self.assertEqual(len(ids), len(expected) + 3)
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'MXx4fDE=', '!!!'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_cursor_rejects_ordering_and_search(self):
+        for params in ({'ordering': 'favorites_count'}, {'search': 'суп'}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url,
+                                           {'cursor': '', **params})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.json())
+
+
+class RecipeQueryBudgetTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(6):
+            create_recipe(cls.author, [(cls.salt, 5), (cls.sugar, 1)],
+                          [cls.tag], name=f'Рецепт {number}')
+        cls.recipe = Recipe.objects.first()
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def assert_queries(self, client, url, cold, warm):
+        with self.assertNumQueries(cold):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(warm):
+            client.get(url)
+        return response.json()
+
+    def test_list(self):
+        for client, flags in ((APIClient(), False), (self.client, True)):
+            with self.subTest(authenticated=flags):
+                self.reset_caches()
+                data = self.assert_queries(client, '/api/recipes/', 6, 2)
+                self.assertEqual(len(data['results']), 6)
+                recipe = next(recipe for recipe in data['results']
+                              if recipe['id'] == self.recipe.id)
+                self.assertIs(recipe['is_favorited'], flags)
+
+    def test_detail(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        for client, flags in ((APIClient(), False), (self.client, True)):
+            with self.subTest(authenticated=flags):
+                self.reset_caches()
+                data = self.assert_queries(client, url, 5, 1)
+                self.assertIs(data['is_favorited'], flags)
+                self.assertIs(data['is_in_shopping_cart'], flags)
+                self.assertEqual(len(data['ingredients']), 2)
+
+
+class RecipeIngredientUpdateTest(APITestCase):
+    written_tables = ('recipes_recipeingredient', 'recipes_recipe_tags')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pepper = Ingredient.objects.create(name='Перец',
+                                               measurement_unit='г')
+        cls.recipe = create_recipe(cls.user, [(cls.salt, 5), (cls.sugar, 1)],
+                                   [cls.tag])
+        ShoppingCart.objects.create(user=cls.author, recipe=cls.recipe)
+
+    def send_patch(self, data, status_code=200):
+        statements = {}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(f'/api/recipes/{self.recipe.id}/',
+                                         data, format='json')
+        self.assertEqual(response.status_code, status_code)
+        for query in context.captured_queries:
+            sql = query['sql']
+            statement = sql.split()[0]
+            if statement in ('INSERT', 'UPDATE', 'DELETE') and any(
+                    table in sql.split(' WHERE ')[0]
+                    for table in self.written_tables):
+                statements[statement] = statements.get(statement, 0) + 1
+        return statements, len(context)
+
+    def patch(self, ingredients, queries):
+        statements, count = self.send_patch(
+            {'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+             'tags': [self.tag.id],
+             'ingredients': [{'id': ingredient.id, 'amount': amount}
+                             for ingredient, amount in ingredients]})
+        self.assertEqual(count, queries)
+        return statements
+
+    def rows(self):
+        return set(RecipeIngredient.objects.filter(recipe=self.recipe)
+                   .values_list('id', 'ingredient', 'amount'))
+
+    def shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(user=self.author)
+                    .values_list('ingredient', 'amount'))
+
+    def test_unchanged_ingredients_are_not_written(self):
+        rows = self.rows()
+        self.assertEqual(
+            self.patch([(self.salt, 5), (self.sugar, 1)], 14), {})
+        self.assertEqual(self.rows(), rows)
+
+    def test_query_count_does_not_grow_with_ingredients(self):
+        ingredients = [(self.salt, 5), (self.sugar, 1)]
+        for number in range(5):
+            ingredients.append((Ingredient.objects.create(
+                name=f'Специя {number}', measurement_unit='г'), 1))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in ingredients[2:])
+        self.assertEqual(self.patch(ingredients, 14), {})
+
+    def test_changed_amount_is_updated_in_place(self):
+        rows = self.rows()
+        self.assertEqual(
+            self.patch([(self.salt, 7), (self.sugar, 1)], 17),
+            {'UPDATE': 1})
+        self.assertEqual(
+            {row[:2] for row in self.rows()}, {row[:2] for row in rows})
+        self.assertEqual(self.shopping_list(),
+                         {self.salt.id: 7, self.sugar.id: 1})
+
+    def test_added_ingredient_is_inserted(self):
+        rows = self.rows()
+        self.assertEqual(
+            self.patch([(self.salt, 5), (self.sugar, 1), (self.pepper, 2)],
+                       17),
+            {'INSERT': 1})
+        self.assertLess(rows, self.rows())
+        self.assertEqual(self.shopping_list()[self.pepper.id], 2)
+
+    def test_removed_ingredient_is_deleted_in_one_statement(self):
+        rows = self.rows()
+        self.assertEqual(self.patch([(self.salt, 5)], 18), {'DELETE': 1})
+        self.assertLess(self.rows(), rows)
+        self.assertEqual(self.shopping_list(), {self.salt.id: 5})
+
+    def test_name_only_patch_keeps_ingredients_and_tags(self):
+        rows = self.rows()
+        statements, _ = self.send_patch({'name': 'Новое название'})
+        self.assertEqual(statements, {})
+        self.assertEqual(self.rows(), rows)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(list(self.recipe.tags.all()), [self.tag])
+
+    def test_invalid_ingredients_and_tags_are_rejected(self):
+        rows = self.rows()
+        for data in (
+            {'ingredients': [{'id': 0, 'amount': 1}]},
+            {'ingredients': [{'id': self.salt.id, 'amount': 1},
+                             {'id': self.salt.id, 'amount': 2}]},
+            {'ingredients': []},
+            {'tags': [0]},
+            {'tags': []},
+            {'cooking_time': 0},
+        ):
+            with self.subTest(data=data):
+                statements, _ = self.send_patch(data, 400)
+                self.assertEqual(statements, {})
+        self.assertEqual(self.rows(), rows)
+
+
+class ShoppingListDownloadTest(APITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipe = create_recipe(cls.author, [(cls.salt, 5), (cls.sugar, 1)])
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def test_download_streams_rows_from_the_database(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'file_format': 'csv'})
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[1:],
+                         ['Сахар,1,г', 'Соль,5,г'])
+
+    def test_matching_etag_is_not_modified(self):
+        for url in (self.url, '/api/recipes/shopping_list/'):
+            etag = self.client.get(url)['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(len(queries), 1, url)
+            self.assertNotIn('recipes_shoppinglistitem', queries[0]['sql'])
+
+    def assert_etag_changes(self, change):
+        for url in (self.url, '/api/recipes/shopping_list/'):
+            etag = self.client.get(url)['ETag']
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag, url)
+
+    def test_etag_changes_when_amount_is_updated_in_place(self):
+        recipe_ingredient = RecipeIngredient.objects.get(ingredient=self.salt)
+
+        def change():
+            recipe_ingredient.amount += 1
+            recipe_ingredient.save()
+
+        self.assert_etag_changes(change)
+
+    def test_etag_changes_when_cart_changes(self):
+        recipe = create_recipe(self.author, [(self.salt, 2)])
+
+        def change():
+            deleted, _ = ShoppingCart.objects.filter(recipe=recipe).delete()
+            if not deleted:
+                ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+        self.assert_etag_changes(change)
+        self.assert_etag_changes(change)
+
+    def test_etag_is_per_user(self):
+        author_client = APIClient()
+        author_client.force_authenticate(self.author)
+        self.assertNotEqual(self.client.get(self.url)['ETag'],
+                            author_client.get(self.url)['ETag'])
+
+    def test_etag_changes_when_ingredient_is_renamed(self):
+        def change():
+            self.salt.name += '!'
+            self.salt.save()
+
+        self.assert_etag_changes(change)
+
+    def test_etag_depends_on_file_format(self):
+        self.assertNotEqual(
+            self.client.get(self.url, {'file_format': 'txt'})['ETag'],
+            self.client.get(self.url, {'file_format': 'csv'})['ETag'])
+
+
+class CartTotalsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = create_recipe(cls.author, [(cls.salt, 5), (cls.sugar, 1)])
+        cls.other = create_recipe(cls.author, [(cls.salt, 2)])
+        ShoppingCart.objects.create(user=cls.author, recipe=cls.other)
+
+    def assert_totals(self, expected):
+        users = User.objects.values('pk')
+        self.assertEqual(set(cart_totals.stored_totals(users)),
+                         set(cart_totals.expected_totals(users)))
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.user)
+                 .values_list('ingredient__name', 'amount')),
+            expected)
+
+    def add_to_cart(self, recipe):
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+
+    def test_add_and_remove_recipes(self):
+        self.add_to_cart(self.recipe)
+        self.assert_totals({'Соль': 5, 'Сахар': 1})
+        self.add_to_cart(self.other)
+        self.assert_totals({'Соль': 7, 'Сахар': 1})
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_totals({'Соль': 2})
+
+    def test_amount_change(self):
+        self.add_to_cart(self.recipe)
+        recipe_ingredient = self.recipe.ingredient.get(ingredient=self.salt)
+        recipe_ingredient.amount = 3
+        recipe_ingredient.save()
+        self.assert_totals({'Соль': 3, 'Сахар': 1})
+
+    def test_ingredient_removed_from_carted_recipe(self):
+        self.add_to_cart(self.recipe)
+        self.add_to_cart(self.other)
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/',
+            {'ingredients': [{'id': self.salt.id, 'amount': 5}]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_totals({'Соль': 7})
+
+    def test_recipe_delete(self):
+        self.add_to_cart(self.recipe)
+        self.add_to_cart(self.other)
+        self.recipe.delete()
+        self.assert_totals({'Соль': 2})
+
+    def test_rebuild_check_reports_and_repairs_drift(self):
+        self.add_to_cart(self.recipe)
+        ShoppingListItem.objects.filter(ingredient=self.sugar).delete()
+        ShoppingListItem.objects.filter(user=self.author).update(amount=9)
+        with self.assertRaisesMessage(CommandError, 'пользователей: 2'):
+            call_command('rebuild_shopping_lists', check=True)
+        self.assertEqual(ShoppingListItem.objects.get(
+            user=self.author).amount, 9)
+        stdout = StringIO()
+        call_command('rebuild_shopping_lists', stdout=stdout)
+        self.assertIn('расхождениями: 2', stdout.getvalue())
+        self.assert_totals({'Соль': 5, 'Сахар': 1})
+        call_command('rebuild_shopping_lists', check=True, verbosity=0)
+
+
+class BatchEndpointsTest(APITestCase):
+    urls = ('/api/recipes/favorite/', '/api/recipes/shopping_cart/',
+            '/api/users/subscribe/')
+
+    def create_targets(self, url, count):
+        if url == '/api/users/subscribe/':
+            start = User.objects.count()
+            User.objects.bulk_create(
+                User(email=f'user{number}@example.com',
+                     username=f'user{number}', first_name='Имя',
+                     last_name='Фамилия')
+                for number in range(start, start + count))
+            return list(User.objects.order_by('-id')
+                        .values_list('id', flat=True)[:count])[::-1]
+        Recipe.objects.bulk_create(
+            Recipe(author=self.author, name=f'Рецепт {number}',
+                   text='Текст', cooking_time=10, image='recipe.png')
+            for number in range(count))
+        recipes = list(Recipe.objects.order_by('-id')
+                       .values_list('id', flat=True)[:count])[::-1]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe_id=recipe, ingredient=self.salt, amount=1)
+            for recipe in recipes)
+        return recipes
+
+    def send(self, method, url, ids, status_code=200):
+        response = getattr(self.client, method)(url, {'ids': ids},
+                                                format='json')
+        self.assertEqual(response.status_code, status_code, response.data)
+        return response.data
+
+    def test_statuses(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                existing, new = self.create_targets(url, 2)
+                self.send('post', url, [existing])
+                self.assertEqual(
+                    self.send('post', url, [existing, new, 999999, existing]),
+                    [{'id': existing, 'status': 'exists'},
+                     {'id': new, 'status': 'created'},
+                     {'id': 999999, 'status': 'not_found'}])
+                self.assertEqual(
+                    self.send('delete', url, [new, 999999]),
+                    [{'id': new, 'status': 'deleted'},
+                     {'id': 999999, 'status': 'not_found'}])
+
+    def test_counters_follow_batch_changes(self):
+        recipes = self.create_targets('/api/recipes/favorite/', 2)
+        self.send('post', '/api/recipes/favorite/', recipes)
+        self.send('delete', '/api/recipes/favorite/', recipes[:1])
+        self.assertEqual(
+            dict(Recipe.objects.filter(pk__in=recipes)
+                 .values_list('pk', 'favorites_count')),
+            {recipes[0]: 0, recipes[1]: 1})
+        self.send('post', '/api/recipes/shopping_cart/', recipes)
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).amount, 2)
+
+    def test_cannot_subscribe_to_self(self):
+        self.assertEqual(
+            self.send('post', '/api/users/subscribe/', [self.user.id]),
+            [{'id': self.user.id, 'status': 'not_found'}])
+
+    def test_ids_limit(self):
+        limit = constants.BATCH_MAX_IDS
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.send('post', url, list(range(1, limit + 1)))
+                self.send('post', url, list(range(1, limit + 2)), 400)
+                self.send('post', url, [], 400)
+                self.send('post', url, [0], 400)
+
+    def test_query_count_does_not_grow_with_ids(self):
+        for url in self.urls:
+            for method in ('post', 'delete'):
+                with self.subTest(url=url, method=method):
+                    counts = []
+                    for count in (1, 50):
+                        ids = self.create_targets(url, count)
+                        if method == 'delete':
+                            self.send('post', url, ids)
+                        with CaptureQueriesContext(connection) as queries:
+                            self.send(method, url, ids)
+                        counts.append(len(queries))
+                    self.assertEqual(counts[0], counts[1])
+
+
+def image_payload(size=(4, 4), image_format='PNG', mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def data_url(content, image_format='png'):
+    return 'data:image/{};base64,{}'.format(
+        image_format, base64.b64encode(content).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DATABASE_REPLICAS=[])
+class RecipeImageTest(TransactionTestCase):
+    url = '/api/recipes/'
+
+    def setUp(self):
+        self.author = create_user(1)
+        self.tag = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                      slug='breakfast')
+        self.salt = Ingredient.objects.create(name='Соль',
+                                              measurement_unit='г')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        patcher = patch.object(images, 'executor', executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, image, status_code=201):
+        response = self.client.post(self.url, {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.salt.id, 'amount': 5}],
+            'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+            'image': image,
+        }, format='json')
+        self.assertEqual(response.status_code, status_code, response.content)
+        images.executor.submit(lambda: None).result()
+        return response
+
+    def test_base64_is_decoded_in_chunks(self):
+        content = image_payload((64, 64))
+        with patch.object(constants, 'BASE64_CHUNK_SIZE', 8):
+            file = images.decode_base64_image(data_url(content))
+        self.assertEqual(file.read(), content)
+        self.assertEqual(file.size, len(content))
+        self.assertEqual(file.content_type, 'image/png')
+        file.close()
+
+    def test_invalid_payloads_are_rejected(self):
+        for image in ('data:image/png;base64,@@@@',
+                      'data:image/png;base64,' + 'A' * 5,
+                      'data:image/png,' + 'A' * 8,
+                      data_url(b'not an image')):
+            with self.subTest(image=image):
+                response = self.create(image, 400)
+                self.assertIn('image', response.json())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_oversized_payloads_are_rejected(self):
+        with patch.object(constants, 'IMAGE_MAX_PIXELS', 15):
+            response = self.create(data_url(image_payload()), 400)
+        self.assertIn('image', response.json())
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1024):
+            response = self.create(
+                data_url(image_payload((512, 512), 'BMP'), 'bmp'), 400)
+        self.assertIn('1024', response.json()['detail'])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_variants_are_generated_and_version_is_bumped(self):
+        for image_format, mode in (('PNG', 'RGBA'), ('JPEG', 'RGB'),
+                                   ('PNG', 'P')):
+            with self.subTest(image_format=image_format, mode=mode):
+                recipe_id = self.create(data_url(
+                    image_payload((2000, 1000), image_format, mode),
+                    image_format.lower())).json()['id']
+                recipe = Recipe.objects.get(pk=recipe_id)
+                self.assertEqual(recipe.version, 2)
+                for field, size in (
+                    ('image_thumbnail', (480, 240)),
+                    ('image_webp', (1600, 800)),
+                ):
+                    variant = getattr(recipe, field)
+                    self.assertEqual(variant.name, images.variant_name(
+                        recipe.image.name, field))
+                    with Image.open(variant.path) as image:
+                        self.assertEqual(image.format, 'WEBP')
+                        self.assertEqual(image.size, size)
+
+
+class RelationCountersTest(APITestCase):
+
+    def assert_counters(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(recipe.favorites_count,
+                             Favorite.objects.filter(recipe=recipe).count())
+        for user in User.objects.all():
+            self.assertEqual(user.followers_count,
+                             Follow.objects.filter(author=user).count())
+            self.assertEqual(user.recipes_count,
+                             Recipe.objects.filter(author=user).count())
+
+    def test_favorite_moved_to_another_recipe(self):
+        first, second = create_recipe(self.author), create_recipe(self.author)
+        favorite = Favorite.objects.create(user=self.user, recipe=first)
+        favorite.save()
+        self.assert_counters()
+        favorite.recipe = second
+        favorite.save()
+        self.assert_counters()
+
+    def test_follow_moved_to_another_author(self):
+        other = create_user(2)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        follow.save()
+        self.assert_counters()
+        follow.author = other
+        follow.save()
+        self.assert_counters()
+
+    def test_follow_moved_to_another_user(self):
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        follow.user = create_user(2)
+        follow.save()
+        self.assert_counters()
+
+    def test_recipe_moved_to_another_author(self):
+        recipe = create_recipe(self.author)
+        recipe.save()
+        self.assert_counters()
+        recipe.author = self.user
+        recipe.save()
+        self.assert_counters()
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FeedTest(TransactionTestCase):
+    url = '/api/recipes/feed/'
+
+    def setUp(self):
+        self.reader = create_user(0)
+        self.author = create_user(1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def publish(self, author, name='Рецепт'):
+        recipe = Recipe.objects.create(author=author, name=name,
+                                       text='Текст', cooking_time=10)
+        self.wait_for_feed()
+        return recipe
+
+    def wait_for_feed(self):
+        feed.executor.submit(lambda: None).result()
+
+    def feed_ids(self, client=None, **params):
+        response = (client or self.client).get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def entries(self, user):
+        return set(FeedEntry.objects.filter(user=user)
+                   .values_list('recipe_id', flat=True))
+
+    def test_new_recipe_is_fanned_out_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        recipe = self.publish(self.author)
+        self.assertEqual(self.entries(self.reader), {recipe.id})
+        self.assertEqual(self.feed_ids(), [recipe.id])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        recipes = [self.publish(self.author) for _ in range(3)]
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.entries(self.reader),
+                         {recipe.id for recipe in recipes})
+        self.assertEqual(self.feed_ids(),
+                         [recipe.id for recipe in reversed(recipes)])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.wait_for_feed()
+        self.assertEqual(self.entries(self.reader), set())
+        self.assertEqual(self.feed_ids(), [])
+
+    @patch.object(constants, 'FEED_FANOUT_MAX_FOLLOWERS', 1)
+    def test_popular_author_is_merged_on_read(self):
+        other = create_user(2)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=create_user(3), author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        first = self.publish(self.author)
+        second = self.publish(other)
+        third = self.publish(self.author)
+        self.assertEqual(self.entries(self.reader), {second.id})
+        self.assertEqual(self.feed_ids(), [third.id, second.id, first.id])
+
+    @patch.object(constants, 'FEED_FANOUT_MAX_FOLLOWERS', 1)
+    def test_author_dropping_below_threshold_is_backfilled(self):
+        follower = create_user(2)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=follower, author=self.author)
+        recipe = self.publish(self.author)
+        self.assertEqual(self.entries(self.reader), set())
+        self.assertEqual(self.feed_ids(), [recipe.id])
+        client = APIClient()
+        client.force_authenticate(follower)
+        response = client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.wait_for_feed()
+        self.assertEqual(self.entries(self.reader), {recipe.id})
+        self.assertEqual(self.feed_ids(), [recipe.id])
+
+    @patch.object(constants, 'FEED_FANOUT_MAX_FOLLOWERS', 1)
+    def test_cursor_pages_through_merged_feed(self):
+        other = create_user(2)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=create_user(3), author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        recipes = [self.publish(author)
+                   for author in (self.author, other) * 3]
+        expected = [recipe.id for recipe in reversed(recipes)]
+        ids, url = [], f'{self.url}?limit=4'
+        while url:
+            response = self.client.get(url).json()
+            ids += [recipe['id'] for recipe in response['results']]
+            previous, url = response['previous'], response['next']
+        self.assertEqual(ids, expected)
+        previous = self.client.get(previous).json()['results']
+        self.assertEqual([recipe['id'] for recipe in previous], expected[:4])
+        response = self.client.get(self.url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TokenCacheTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        local_cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def is_cached(self):
+        return local_cache.get(cache_key(self.token.key)) is not None
+
+    def assert_invalidated(self, status_code):
+        self.assertFalse(self.is_cached())
+        self.assertEqual(self.client.get('/api/users/me/').status_code,
+                         status_code)
+
+    def test_cached_request_runs_no_auth_queries(self):
+        self.client.get('/api/users/me/')
+        self.assertTrue(self.is_cached())
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/?omit=is_subscribed')
+        self.assertEqual(response.json()['id'], self.user.id)
+
+    def test_cached_user_is_not_shared(self):
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.key)
+        second, token = authentication.authenticate_credentials(self.token.key)
+        third, _ = authentication.authenticate_credentials(self.token.key)
+        self.assertIsNot(second, third)
+        second.first_name = 'Изменено'
+        self.assertEqual(third.first_name, 'Имя')
+        self.assertIs(token.user, second)
+
+    def test_logout(self):
+        self.client.get('/api/users/me/')
+        self.assertEqual(
+            self.client.post('/api/auth/token/logout/').status_code, 204)
+        self.assert_invalidated(401)
+
+    def test_token_delete(self):
+        self.client.get('/api/users/me/')
+        Token.objects.filter(user=self.user).delete()
+        self.assert_invalidated(401)
+
+    def test_user_deactivation(self):
+        self.client.get('/api/users/me/')
+        self.user.is_active = False
+        self.user.save()
+        self.assert_invalidated(401)
+
+    def test_password_change(self):
+        self.client.get('/api/users/me/')
+        response = self.client.post(
+            '/api/users/set_password/',
+            {'current_password': 'password-123',
+             'new_password': 'new-password-456'})
+        self.assertEqual(response.status_code, 204)
+        self.assert_invalidated(200)
+        user, _ = CachedTokenAuthentication().authenticate_credentials(
+            self.token.key)
+        self.assertTrue(user.check_password('new-password-456'))
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'SQLite в памяти не выполняет параллельные записи')
+@override_settings(DATABASE_REPLICAS=[])
+class ConcurrentTogglesTest(TransactionTestCase):
+    concurrency = 8
+
+    def setUp(self):
+        self.user = create_user(0)
+        self.author = create_user(1)
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        Recipe.objects.bulk_create([Recipe(author=self.author, name='Рецепт',
+                                           text='Текст', cooking_time=10)])
+        self.recipe = Recipe.objects.get()
+        RecipeIngredient.objects.create(recipe=self.recipe,
+                                        ingredient=ingredient, amount=5)
+
+    def request(self, barrier, method, url):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        barrier.wait()
+        try:
+            return getattr(client, method)(url).status_code
+        finally:
+            connection.close()
+
+    def burst(self, method, url):
+        barrier = threading.Barrier(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.request, barrier, method, url)
+                       for _ in range(self.concurrency)]
+            return Counter(future.result() for future in futures)
+
+    def assert_consistent(self):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count,
+                         Favorite.objects.filter(recipe=self.recipe).count())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count,
+                         Follow.objects.filter(author=self.author).count())
+        users = User.objects.filter(pk=self.user.pk).values('pk')
+        self.assertEqual(set(cart_totals.expected_totals(users)),
+                         set(cart_totals.stored_totals(users)))
+
+    def test_parallel_toggles(self):
+        for model, url in (
+            (Favorite, f'/api/recipes/{self.recipe.id}/favorite/'),
+            (ShoppingCart, f'/api/recipes/{self.recipe.id}/shopping_cart/'),
+            (Follow, f'/api/users/{self.author.id}/subscribe/'),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.burst('post', url),
+                                 {201: 1, 400: self.concurrency - 1})
+                self.assertEqual(model.objects.count(), 1)
+                self.assert_consistent()
+                self.assertEqual(self.burst('delete', url),
+                                 {204: 1, 404: self.concurrency - 1})
+                self.assertEqual(model.objects.count(), 0)
+                self.assert_consistent()
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Планы запросов проверяются только на PostgreSQL')
+class QueryPlanTest(APITestCase):
+    hot_tables = frozenset((
+        'recipes_user',
+        'recipes_recipe',
+        'recipes_recipe_tags',
+        'recipes_recipeingredient',
+        'recipes_favorite',
+        'recipes_shoppingcart',
+        'recipes_follow',
+        'recipes_feedentry',
+        'recipes_shoppinglistitem',
+    ))
+    seq_scan = re.compile(r'Seq Scan on (\w+)')
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(self.author, [(self.salt, 5)], [self.tag])
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        Follow.objects.create(user=self.user, author=self.author)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def captured_selects(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [query['sql'] for query in queries.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT')]
+
+    def test_hot_tables_are_read_through_indexes(self):
+        recipe, tag = self.recipe, self.tag
+        for url in (
+            '/api/recipes/?cursor=',
+            f'/api/recipes/?cursor=&tags={tag.slug}',
+            '/api/recipes/?cursor=&is_favorited=1',
+            '/api/recipes/?cursor=&is_in_shopping_cart=1',
+            f'/api/recipes/?cursor=&author={recipe.author_id}',
+            f'/api/recipes/{recipe.id}/',
+            '/api/users/subscriptions/?recipes_limit=3',
+            '/api/recipes/feed/',
+            '/api/recipes/download_shopping_cart/',
+            '/api/recipes/shopping_list/',
+        ):
+            self.reset_caches()
+            for sql in self.captured_selects(url):
+                plan = self.explain(sql)
+                with self.subTest(url=url, sql=sql):
+                    self.assertFalse(
+                        self.hot_tables.intersection(
+                            self.seq_scan.findall(plan)), plan)
+
+
+@override_settings(ROOT_URLCONF=__name__, DATABASE_REPLICAS=[])
+class AsyncViewsTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = create_user(0)
+        self.author = create_user(1)
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        for amount in (5, 1):
+            self.recipe = Recipe.objects.create(
+                author=self.author, name='Рецепт', text='Текст',
+                cooking_time=10)
+            RecipeIngredient.objects.create(recipe=self.recipe,
+                                            ingredient=salt, amount=amount)
+        feed.executor.submit(lambda: None).result()
+        token = Token.objects.create(user=self.user)
+        self.credentials = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    def send(self, prefix, method, url, authenticated=True, **extra):
+        if authenticated:
+            extra.update(self.credentials)
+        if prefix == 'async':
+            headers = {name[5:].replace('_', '-'): value
+                       for name, value in extra.items()}
+            return async_to_sync(getattr(AsyncClient(), method))(
+                f'/async/{url}', **headers)
+        return getattr(APIClient(), method)(f'/api/{url}', **extra)
+
+    def describe(self, response):
+        content = response.getvalue()
+        if response.get('Content-Type') == 'application/json' and content:
+            content = orjson.loads(content)
+        return (response.status_code, content or None,
+                response.get('Content-Type') if content else None,
+                response.get('ETag'), response.get('WWW-Authenticate'))
+
+    def assert_same_responses(self, requests):
+        responses = {
+            prefix: [self.describe(self.send(prefix, *request, **extra))
+                     for *request, extra in requests]
+            for prefix in ('api', 'async')
+        }
+        self.assertEqual(responses['async'], responses['api'])
+        return [response[0] for response in responses['async']]
+
+    def assert_toggle(self, url, missing_url):
+        self.assertEqual(self.assert_same_responses([
+            ('post', url, {}),
+            ('post', url, {}),
+            ('delete', url, {}),
+            ('delete', url, {}),
+            ('post', missing_url, {}),
+            ('get', url, {}),
+            ('post', url, False, {}),
+        ]), [201, 400, 204, 404, 404, 405, 401])
+
+    def test_favorite(self):
+        self.assert_toggle(f'recipes/{self.recipe.id}/favorite/',
+                           'recipes/999999/favorite/')
+
+    def test_shopping_cart(self):
+        self.assert_toggle(f'recipes/{self.recipe.id}/shopping_cart/',
+                           'recipes/999999/shopping_cart/')
+
+    def test_subscribe(self):
+        url = f'users/{self.author.id}/subscribe/'
+        self.assert_toggle(url + '?recipes_limit=1',
+                           'users/999999/subscribe/')
+        self.assertEqual(self.assert_same_responses([
+            ('post', f'users/{self.user.id}/subscribe/', {}),
+            ('post', url + '?recipes_limit=abc', {}),
+        ]), [400, 400])
+
+    def test_download_shopping_cart(self):
+        url = 'recipes/download_shopping_cart/'
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        etag = self.send('api', 'get', url)['ETag']
+        self.assertEqual(self.assert_same_responses([
+            ('get', url, {}),
+            ('get', url + '?file_format=csv', {}),
+            ('get', url, {'HTTP_IF_NONE_MATCH': etag}),
+            ('get', url + '?file_format=pdf', {}),
+            ('post', url, {}),
+            ('get', url, False, {}),
+        ]), [200, 200, 304, 200, 405, 401])
+
+
+@override_settings(API_METRICS=True)
+class QueryMetricsMiddlewareTest(APITestCase):
+
+    def test_middleware_keeps_async_chain(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(asyncio.iscoroutinefunction(
+            query_metrics_middleware(get_response)))
+
+    def test_sync_request_gets_server_timing(self):
+        response = self.client.get('/api/tags/')
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    async def test_async_request_gets_server_timing(self):
+        response = await AsyncClient().get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class ORJSONTest(APITestCase):
+
+    def test_renderer_matches_drf_json(self):
+        data = {'id': 1, 'amount': Decimal('1.50'), 'name': 'Соль',
+                'created': datetime(2024, 1, 2, 3, 4, 5,
+                                    tzinfo=timezone.utc),
+                1: [None, True]}
+        content = ORJSONRenderer().render(data)
+        self.assertEqual(orjson.loads(content),
+                         orjson.loads(JSONRenderer().render(data)))
+        self.assertIn(b'"2024-01-02T03:04:05Z"', content)
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_renderer_indent(self):
+        renderer = ORJSONRenderer()
+        self.assertNotIn(b'\n', renderer.render({'id': 1}))
+        self.assertIn(b'\n', renderer.render(
+            {'id': 1}, 'application/json; indent=4'))
+        self.assertIn(b'\n', renderer.render(
+            {'id': 1}, renderer_context={'indent': 2}))
+
+    def test_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"name": "Соль"}'.encode())),
+                         {'name': 'Соль'})
+        with self.assertRaises(ParseError):
+            parser.parse(BytesIO(b'{"name":'))
+
+    def test_api_round_trip(self):
+        response = self.client.post(
+            '/api/recipes/', '{"name":', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(orjson.loads(response.content)[0]['slug'],
+                         'breakfast')
+
+
+class CompressionTest(APITestCase):
+    content = orjson.dumps([{'name': f'Ингредиент {number}'}
+                            for number in range(100)])
+
+    def response(self, content=None, content_type='application/json'):
+        response = HttpResponse(self.content if content is None else content,
+                                content_type=content_type)
+        response['ETag'] = '"etag"'
+        return response
+
+    def compress(self, accept_encoding, response=None):
+        request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return compress_response(request, response or self.response())
+
+    def test_choose_encoding(self):
+        for header, encoding in (
+            ('', None),
+            ('gzip, deflate, br', 'br'),
+            ('gzip', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('BR; q=1, gzip; q=0.9', 'br'),
+            ('br;q=0, gzip;q=0', None),
+            ('br;q=abc, gzip', 'gzip'),
+            ('*', 'br'),
+            ('*;q=0.5, br;q=0', 'gzip'),
+            ('identity', None),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(choose_encoding(header), encoding)
+
+    def test_negotiated_encodings(self):
+        for header, decompress in (('br', brotli.decompress),
+                                   ('gzip', gzip.decompress)):
+            with self.subTest(header=header):
+                response = self.compress(header)
+                self.assertEqual(response['Content-Encoding'], header)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(response['ETag'], 'W/"etag"')
+                self.assertEqual(int(response['Content-Length']),
+                                 len(response.content))
+                self.assertEqual(decompress(response.content), self.content)
+
+    def test_uncompressed_responses(self):
+        response = self.compress('br;q=0, gzip;q=0')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.content)
+        for response in (
+            self.response(self.content[:constants.COMPRESSION_MIN_SIZE - 1]),
+            self.response(content_type='image/png'),
+        ):
+            with self.subTest(content_type=response['Content-Type']):
+                response = self.compress('br', response)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertFalse(response.has_header('Vary'))
+                self.assertEqual(response['ETag'], '"etag"')
+
+    def test_streaming_response(self):
+        response = StreamingHttpResponse(
+            iter([self.content] * 3), content_type='text/csv')
+        response = self.compress('gzip', response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            self.content * 3)
+
+    def test_api_response_is_compressed(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(100))
+        response = self.client.get('/api/ingredients/',
+                                   HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(orjson.loads(brotli.decompress(
+            response.content))), 102)
+
+
+class MetricsViewTest(TestCase):
+
+    def get(self, **headers):
+        return metrics_view(RequestFactory().get('/api/metrics/', **headers))
+
+    @override_settings(API_METRICS_TOKEN='secret')
+    def test_scraper_with_token_gets_metrics(self):
+        response = self.get(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE', response.content)
+
+    @override_settings(API_METRICS_TOKEN='secret')
+    def test_request_without_valid_token_is_forbidden(self):
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'},
+                        {'HTTP_AUTHORIZATION': 'secret'}):
+            with self.subTest(headers=headers):
+                self.assertEqual(self.get(**headers).status_code, 403)
+
+    @override_settings(API_METRICS_TOKEN='')
+    def test_metrics_are_closed_without_configured_token(self):
+        self.assertEqual(
+            self.get(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+
+@skipUnless('replica_0' in settings.DATABASES,
+            'Нужен псевдоним replica_0, например DB_REPLICA_HOSTS=db')
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_PIN_SECONDS=15)
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {'default'} | {'replica_0'}.intersection(settings.DATABASES)
+
+    def setUp(self):
+        caches['default'].clear()
+        tag_cache.invalidate()
+        self.user = create_user(0)
+        Recipe.objects.bulk_create([Recipe(author=create_user(1),
+                                           name='Рецепт', text='Текст',
+                                           cooking_time=10)])
+        self.recipe = Recipe.objects.get()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request(self, method, url, **extra):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_0']) as replica:
+            response = getattr(self.client, method)(url, **extra)
+        self.assertLess(response.status_code, 400)
+        return response, primary.captured_queries, replica.captured_queries
+
+    def test_safe_read_goes_to_replica(self):
+        response, primary, replica = self.request('get', '/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['id'], self.recipe.id)
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+
+    def test_writes_go_to_primary(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        for method in ('post', 'delete'):
+            with self.subTest(method=method):
+                _, primary, replica = self.request(method, url)
+                self.assertTrue(primary)
+                self.assertEqual(replica, [])
+
+    def test_write_pins_reads_to_primary(self):
+        response, _, _ = self.request(
+            'post', f'/api/recipes/{self.recipe.id}/favorite/')
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 15)
+        self.assertTrue(cookie['httponly'])
+        _, primary, replica = self.request('get', '/api/recipes/')
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+        del self.client.cookies[PIN_COOKIE]
+        _, primary, replica = self.request('get', '/api/recipes/')
+        self.assertEqual(primary, [])
+        self.assertTrue(replica)
+
+    def test_token_lookup_reads_from_primary(self):
+        token = Token.objects.create(user=self.user)
+        self.client.force_authenticate()
+        local_cache.clear()
+        _, primary, replica = self.request(
+            'get', '/api/users/me/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertTrue(
+            any('authtoken_token' in query['sql'] for query in primary))
+        self.assertFalse(
+            any('authtoken_token' in query['sql'] for query in replica))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        response, primary, replica = self.request('get', '/api/recipes/')
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+        response, _, replica = self.request(
+            'post', f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(replica, [])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(router.db_for_read(Recipe), 'default')
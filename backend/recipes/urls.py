@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
 
+from recipes import async_views
+from recipes.metrics import metrics_view
+
 from recipes.views import (RecipeViewSet,
                            IngredientViewSet,
                            TagViewSet,
@@ -17,3 +21,17 @@ urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
+
+if settings.API_METRICS:
+    urlpatterns.append(path('metrics/', metrics_view, name='metrics'))
+
+async_urlpatterns = [
+    path('recipes/<int:pk>/favorite/', async_views.favorite),
+    path('recipes/<int:pk>/shopping_cart/', async_views.shopping_cart),
+    path('recipes/download_shopping_cart/',
+         async_views.download_shopping_cart),
+    path('users/<int:pk>/subscribe/', async_views.subscribe),
+]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns + urlpatterns
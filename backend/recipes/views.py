@@ -1,141 +1,275 @@
 from rest_framework import viewsets, status
+from rest_framework.filters import OrderingFilter
 from django_filters import rest_framework as filters
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.http.response import HttpResponse
-from django.db.models import Sum
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.settings import api_settings
+from django.utils.cache import get_conditional_response, patch_cache_control
 from djoser.views import UserViewSet
 
 from recipes.models import (Recipe, Ingredient,
-                            Tag, Follow,
-                            Favorite, ShoppingCart,
-                            RecipeIngredient,
-                            User)
+                            Tag, User)
 from .serializers import (RecipeSerializer,
                           IngredientSerializer,
                           TagSerializer,
                           FollowAuthorSerializer,
+                          CustomUserSerializer,
                           FollowingSerializer,
                           FavoriteSerializer,
                           ShoppingCartSerializer,
-                          RecipeCreateSerializer)
+                          RecipeCreateSerializer,
+                          BatchSerializer)
 from .permissions import AuthorOrReadOnly
-from .filters import IngredientFilter, RecipeFilter
-from .paginations import CustomPaginator
+from .filters import RecipeFilter
+from .caching import conditional_response
+from .constants import RECIPE_COMPACT_FIELDS
+from .fieldsets import readable_fields, selected_fields
+from .ingredient_index import ingredient_index
+from .tag_cache import tag_cache
+from .paginations import CustomPaginator, FeedPaginator, RecipePaginator
+from .feed import Feed
+from . import recipe_cache, relations, shopping_list
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
+    authentication_classes = ()
     permission_classes = (AllowAny,)
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return conditional_response(request, *tag_cache.list())
+
+    def retrieve(self, request, *args, **kwargs):
+        tag = tag_cache.detail(kwargs['pk'])
+        if tag is None:
+            raise NotFound
+        return conditional_response(request, *tag)
+
+
+def parse_recipes_limit(query_params):
+    limit = query_params.get('recipes_limit')
+    if not limit:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = None
+    if limit is None or limit < 0:
+        raise ValidationError(
+            {'recipes_limit': 'Должно быть целым неотрицательным числом'})
+    return limit
+
+
+def toggle(request, relation, pk, serializer_class, context=None):
+    try:
+        pk = int(pk)
+    except ValueError:
+        raise NotFound
+    if request.method == 'DELETE':
+        if not relation.remove(request.user, [pk]):
+            raise NotFound
+        return None
+    target = get_object_or_404(relation.target_model, pk=pk)
+    message = relation.validate(request.user, target)
+    if message is None and not relation.add_one(request.user, target):
+        message = relation.exists_message
+    if message is not None:
+        raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+    instance = relation.model(user=request.user, **{relation.field: target})
+    return serializer_class(
+        instance, context={'request': request, **(context or {})}).data
+
+
+def toggle_response(data):
+    if data is None:
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(data, status=status.HTTP_201_CREATED)
+
+
+def apply_batch(relation, request):
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    if request.method == 'POST':
+        found, created = relation.add(request.user, ids)
+        statuses = {pk: 'created' if pk in created else 'exists'
+                    for pk in found}
+    else:
+        statuses = dict.fromkeys(relation.remove(request.user, ids),
+                                 'deleted')
+    return Response([{'id': pk, 'status': statuses.get(pk, 'not_found')}
+                     for pk in ids])
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (AuthorOrReadOnly,)
-    pagination_class = CustomPaginator
-    filter_backends = (filters.DjangoFilterBackend,)
+    pagination_class = RecipePaginator
+    filter_backends = (filters.DjangoFilterBackend, OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count')
+
+    @cached_property
+    def response_fields(self):
+        return selected_fields(self.request.query_params,
+                               recipe_cache.FIELDS,
+                               {'compact': RECIPE_COMPACT_FIELDS})
+
+    def get_queryset(self):
+        user = self.request.user
+        if self.action in ('list', 'retrieve'):
+            return recipe_cache.rows(user, self.response_fields)
+        return (Recipe.objects
+                .defer('search_vector')
+                .with_related(user)
+                .with_user_flags(user))
 
     def get_serializer_class(self):
-        if self.action == 'create' or 'update':
+        if self.action in ('create', 'update', 'partial_update'):
             return RecipeCreateSerializer
         return RecipeSerializer
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(recipe_cache.represent(
+                queryset, request, True, self.response_fields))
+        return self.get_paginated_response(recipe_cache.represent(
+            page, request, True, self.response_fields))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(recipe_cache.represent(
+            (self.get_object(),), request, False, self.response_fields)[0])
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     @action(detail=True, methods=['POST', 'DELETE'],
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-        if request.method == 'POST':
-            serializer = FavoriteSerializer(data={'user': request.user.id,
-                                                  'recipe': recipe.id},
-                                            context={'request': request},)
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user, recipe=recipe)
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        get_object_or_404(Favorite, user=request.user,
-                          recipe=recipe).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return toggle_response(toggle(request, relations.favorites,
+                                      kwargs['pk'], FavoriteSerializer))
 
     @action(detail=True, methods=['POST', 'DELETE'],
             permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-        if request.method == 'POST':
-            serializer = ShoppingCartSerializer(data={'user': request.user.id,
-                                                      'recipe': recipe.id},
-                                                context={'request': request,
-                                                         'recipe': recipe})
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user, recipe=recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        get_object_or_404(ShoppingCart, user=request.user,
-                          recipe=recipe).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return toggle_response(toggle(request, relations.shopping_cart,
+                                      kwargs['pk'], ShoppingCartSerializer))
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            permission_classes=(IsAuthenticated,), url_path='favorite')
+    def favorite_batch(self, request):
+        return apply_batch(relations.favorites, request)
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            permission_classes=(IsAuthenticated,), url_path='shopping_cart')
+    def shopping_cart_batch(self, request):
+        return apply_batch(relations.shopping_cart, request)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPaginator)
+    def feed(self, request):
+        page = self.paginate_queryset(Feed(
+            request.user,
+            recipe_cache.rows(request.user, self.response_fields)))
+        return self.get_paginated_response(recipe_cache.represent(
+            page, request, True, self.response_fields))
 
     @action(detail=False, methods=['GET'],
             permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request, **kwargs):
-        ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__shopping_cart__user=request.user)
-            .values('ingredient').annotate(total_amount=Sum('amount'))
-            .values_list('ingredient__name', 'total_amount',
-                         'ingredient__measurement_unit')
-        )
-        file_list = []
-        [file_list.append(
-            '___ {} - {} {}'.format(*ingredient))
-            for ingredient in ingredients]
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(file_list),
-                            content_type='text/plain')
-        file['Content-Disposition'] = ('attachment; filename=Список покупок')
-        return file
+        file_format = shopping_list.get_file_format(request.query_params)
+        etag = shopping_list.cart_etag(request.user, file_format)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        return shopping_list.file_response(
+            shopping_list.cart_ingredients(request.user), file_format, etag)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=(IsAuthenticated,))
+    def shopping_list(self, request):
+        etag = shopping_list.cart_etag(request.user, 'json')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = Response(shopping_list.cart_items(request.user))
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = IngredientSerializer
-    filter_backends = (filters.DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return Response(
+            ingredient_index.search(request.query_params.get('name', '')))
+
 
 class CustomUserViesSet(UserViewSet):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = CustomPaginator
 
+    def get_recipes_limit(self):
+        return parse_recipes_limit(self.request.query_params)
+
+    @cached_property
+    def response_fields(self):
+        if self.action == 'subscriptions':
+            serializer_class = FollowingSerializer
+        else:
+            serializer_class = CustomUserSerializer
+        return selected_fields(self.request.query_params,
+                               readable_fields(serializer_class))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if (self.action in ('list', 'retrieve')
+                and 'is_subscribed' in self.response_fields):
+            return queryset.with_subscription(self.request.user)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if (self.request.method == 'GET'
+                and self.action in ('list', 'retrieve', 'me')):
+            kwargs['fields'] = self.response_fields
+        return super().get_serializer(*args, **kwargs)
+
     @action(detail=False, methods=['GET'],
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        page = self.paginate_queryset(
-            User.objects.filter(follower__user=self.request.user)
-        )
-        serializer = FollowingSerializer(page, many=True,
+        fields = self.response_fields
+        queryset = User.objects.filter(follower__user=self.request.user)
+        if 'is_subscribed' in fields:
+            queryset = queryset.with_subscription(self.request.user)
+        if 'recipes' in fields:
+            queryset = queryset.with_recipes_preview(self.get_recipes_limit())
+        page = self.paginate_queryset(queryset.order_by('id'))
+        serializer = FollowingSerializer(page, many=True, fields=fields,
                                          context={'request': request})
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['POST', 'DELETE'],
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs['id'])
-        if request.method == 'POST':
-            serializer = FollowAuthorSerializer(data={'user': request.user.id,
-                                                      'author': author.id},
-                                                context={'request': request,
-                                                         'author': author})
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user, author=author)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        get_object_or_404(Follow, user=request.user, author=author).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return toggle_response(toggle(
+            request, relations.follows, kwargs['id'], FollowAuthorSerializer,
+            {'recipes_limit': self.get_recipes_limit()}))
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            permission_classes=(IsAuthenticated,), url_path='subscribe')
+    def subscribe_batch(self, request):
+        return apply_batch(relations.follows, request)